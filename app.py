@@ -1,34 +1,70 @@
 from flask import Flask, request, render_template, redirect, url_for, jsonify
 import logging
-import subprocess
-import threading
-import sys
 import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from url_verifier import verify_url
+from jinja2 import FileSystemBytecodeCache
+import crawl_runner
+from url_verifier import verify_url_cached
 from operations import DatabaseOperations
 from progress_tracker import ProgressTracker
 from config import Config
+from log_config import setup_logging
 
 # Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+setup_logging()
 
 logger = logging.getLogger(__name__)
 app = Flask(__name__, template_folder='templates')
 
+# Templates don't change at runtime: skip mtime checks and reuse compiled bytecode
+app.config['TEMPLATES_AUTO_RELOAD'] = False
+app.jinja_env.auto_reload = False
+os.makedirs(Config.JINJA_CACHE_DIR, exist_ok=True)
+app.jinja_env.bytecode_cache = FileSystemBytecodeCache(Config.JINJA_CACHE_DIR)
+
 Config.validate()
 DatabaseOperations.initialize_database()
 
-# Dictionary to store running crawl processes
-active_crawls = {}
+# Background executor for post-verification bookkeeping so POST / can redirect immediately
+_setup_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='crawl-setup')
 
 
-def run_crawl_task(url, domain):
-    """Run Scrapy spider in subprocess with real-time output capture"""
-    process = None
+def _post_verification_setup(domain, verification, url):
+    """
+    Persist SSL info, reset progress and schedule the crawl (runs on the setup executor).
+    Takes over the request's crawl_runner reservation.
+    """
+    try:
+        # Save SSL info
+        DatabaseOperations.insert_ssl_info(
+            domain,
+            verification.get('ssl_provider', 'Unknown'),
+            verification.get('ssl_expiry')
+        )
+
+        # Initialize progress tracker
+        ProgressTracker(domain).reset()
+
+        # Log task initiation
+        DatabaseOperations.insert_log(domain, f"Crawl task initiated for {url}", "INFO")
+
+    except Exception as e:
+        logger.exception(f"Post-verification setup failed for {domain}: {e}")
+        crawl_runner.release()
+        return
+
+    # Schedule crawl on the shared reactor thread
+    run_crawl_task(url, domain, reserved=True)
+    logger.info(f"Crawl scheduled for domain: {domain}")
+
+
+def run_crawl_task(url, domain, reserved=False):
+    """
+    Prepare crawl bookkeeping and schedule the spider on the shared reactor without blocking.
+    With `reserved`, a crawl_runner.try_reserve() slot is used (and released if scheduling fails).
+    """
+    submitted = False
     try:
         logger.info(f"=" * 80)
         logger.info(f"Starting crawl task for URL: {url}, Domain: {domain}")
@@ -48,150 +84,47 @@ def run_crawl_task(url, domain):
             start_time=datetime.now()
         )
 
-        # Get the current Python executable and script directory
-        python_executable = sys.executable
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        spider_path = os.path.join(script_dir, 'spider.py')
-
-        # Verify spider file exists
-        if not os.path.exists(spider_path):
-            raise FileNotFoundError(f"Spider file not found: {spider_path}")
-
-        # Prepare scrapy command with full paths
-        cmd = [
-            python_executable, '-m', 'scrapy', 'runspider', spider_path,
-            '-a', f'start_url={url}',
-            '-a', f'domain={domain}',
-            '-s', 'ITEM_PIPELINES={"pipelines.PostgreSQLPipeline": 300}',
-            '-s', 'LOG_ENABLED=True',
-            '-s', 'LOG_LEVEL=INFO',
-            '-s', 'LOG_STDOUT=True',
-        ]
-
-        logger.info(f"Executing command: {' '.join(cmd)}")
-        logger.info(f"Working directory: {script_dir}")
-        DatabaseOperations.insert_log(domain, f"Executing spider command", "INFO")
-
-        # Run subprocess with real-time output
-        process = subprocess.Popen(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,  # Merge stderr with stdout
-            text=True,
-            bufsize=1,
-            universal_newlines=True,
-            cwd=script_dir,
-            env=os.environ.copy()
-        )
+        DatabaseOperations.insert_log(domain, f"Starting in-process spider", "INFO")
 
-        # Store process for tracking
-        active_crawls[domain] = process
-        logger.info(f"Spider process started with PID: {process.pid}")
-
-        # Monitor process output in real-time
-        output_lines = []
-        for line in iter(process.stdout.readline, ''):
-            if not line:
-                break
-
-            line = line.strip()
-            output_lines.append(line)
-
-            # Log important lines
-            if any(keyword in line for keyword in ['ERROR', 'WARNING', 'Crawling:', 'UPLOAD', 'PROGRESS', 'CLOSED']):
-                logger.info(f"[SPIDER] {line}")
-
-            # Extract progress info
-            if 'PROGRESS' in line or 'Crawling:' in line:
-                DatabaseOperations.insert_log(domain, line[:500], "INFO")
-
-        # Wait for process to complete
-        return_code = process.wait(timeout=3600)  # 1 hour timeout
-
-        # Log final output
-        logger.info(f"Spider process completed with return code: {return_code}")
-
-        # Save last 50 lines of output
-        for line in output_lines[-50:]:
-            if line.strip():
-                logger.info(f"[OUTPUT] {line}")
-
-        # Check result
-        if return_code == 0:
-            final_progress = tracker.get_percentage()
-            logger.info(f"✓ Crawl completed successfully for {domain}. Progress: {final_progress}%")
-            DatabaseOperations.insert_log(domain, f"Crawl completed successfully", "INFO")
-            DatabaseOperations.update_crawl_statistics(
-                domain=domain,
-                status='completed',
-                end_time=datetime.now()
-            )
-        else:
-            error_msg = f"Spider exited with code {return_code}"
-            logger.error(f"✗ Crawl failed for {domain}: {error_msg}")
-
-            # Log error details
-            error_lines = [l for l in output_lines if 'ERROR' in l or 'Traceback' in l]
-            for error_line in error_lines[-10:]:
-                logger.error(f"[ERROR] {error_line}")
-
-            DatabaseOperations.insert_log(domain, f"Crawl failed: {error_msg}", "ERROR")
-            DatabaseOperations.update_crawl_statistics(
-                domain=domain,
-                status='failed',
-                end_time=datetime.now()
-            )
-
-    except subprocess.TimeoutExpired:
-        error_msg = "Spider execution timed out after 1 hour"
-        logger.error(f"✗ {error_msg} for {domain}")
-        DatabaseOperations.insert_log(domain, error_msg, "ERROR")
-        DatabaseOperations.update_crawl_statistics(
-            domain=domain,
-            status='failed',
-            end_time=datetime.now()
-        )
-        if process:
-            process.kill()
-            process.wait()
-
-    except FileNotFoundError as e:
-        error_msg = f"File not found: {str(e)}"
-        logger.error(f"✗ {error_msg}")
-        DatabaseOperations.insert_log(domain, error_msg, "ERROR")
-        DatabaseOperations.update_crawl_statistics(
-            domain=domain,
-            status='failed',
-            end_time=datetime.now()
+        # Completion is handled on the reactor thread when the spider closes
+        crawl_runner.submit_crawl(
+            url, domain,
+            on_finished=lambda finish_reason, error: finish_crawl_task(domain, finish_reason, error),
+            reserved=reserved
         )
+        submitted = True
 
     except Exception as e:
-        error_msg = str(e)
-        logger.error(f"✗ Crawl task failed unexpectedly: {error_msg}", exc_info=True)
-        DatabaseOperations.insert_log(domain, f"Task failed: {error_msg[:500]}", "ERROR")
-        DatabaseOperations.update_crawl_statistics(
-            domain=domain,
-            status='failed',
-            end_time=datetime.now()
-        )
+        if reserved and not submitted:
+            crawl_runner.release()
+        finish_crawl_task(domain, None, e)
+
+
+def finish_crawl_task(domain, finish_reason, error=None):
+    """Record the outcome of a crawl once its spider has closed"""
+    if error is not None:
+        error_msg = str(error)
+        logger.error(f"✗ Crawl task failed unexpectedly: {error_msg}", exc_info=error)
+        DatabaseOperations.finalize_crawl(domain, 'failed', f"Task failed: {error_msg[:500]}", "ERROR")
+        return
+
+    logger.info(f"Spider finished with reason: {finish_reason}")
 
-    finally:
-        # Cleanup
-        if domain in active_crawls:
-            del active_crawls[domain]
-        if process and process.poll() is None:
-            try:
-                logger.warning(f"Terminating hanging process for {domain}")
-                process.terminate()
-                process.wait(timeout=5)
-            except:
-                logger.error(f"Force killing process for {domain}")
-                process.kill()
+    # Check result
+    if crawl_runner.is_success(finish_reason):
+        final_progress = ProgressTracker(domain).get_percentage()
+        logger.info(f"✓ Crawl completed successfully for {domain}. Progress: {final_progress}%")
+        DatabaseOperations.finalize_crawl(domain, 'completed', f"Crawl completed successfully", "INFO")
+    else:
+        error_msg = f"Spider finished with reason {finish_reason}"
+        logger.error(f"✗ Crawl failed for {domain}: {error_msg}")
+        DatabaseOperations.finalize_crawl(domain, 'failed', f"Crawl failed: {error_msg}", "ERROR")
 
 
 @app.route('/', methods=['GET', 'POST'])
 def index():
     if request.method == 'POST':
+        reserved = False
         try:
             url = request.form.get('url')
             if not url:
@@ -200,8 +133,14 @@ def index():
 
             logger.info(f"Received URL: {url}")
 
+            # Reserve the crawl slot before verifying, so a burst can't all pass the check
+            if not crawl_runner.try_reserve():
+                logger.warning(f"Crawl queue full ({crawl_runner.pending_crawls()} pending), rejecting {url}")
+                return "Too many crawls in progress, try again later", 429
+            reserved = True
+
             # Verify URL
-            verification = verify_url(url)
+            verification, cache_status = verify_url_cached(url)
             domain = verification.get('domain')
 
             if not domain:
@@ -213,37 +152,29 @@ def index():
 
             # Check verification status
             if verification.get('dns_valid') and verification.get('socket_valid'):
-                # Save SSL info
-                DatabaseOperations.insert_ssl_info(
-                    domain,
-                    verification.get('ssl_provider', 'Unknown'),
-                    verification.get('ssl_expiry')
-                )
-
-                # Initialize progress tracker
-                ProgressTracker(domain).reset()
-
-                # Log task initiation
-                DatabaseOperations.insert_log(domain, f"Crawl task initiated for {url}", "INFO")
-
-                # Start crawl in background thread
-                thread = threading.Thread(target=run_crawl_task, args=(url, domain), daemon=True)
-                thread.start()
+                # DB/Redis setup and crawl scheduling happen off the request thread
+                _setup_executor.submit(_post_verification_setup, domain, verification, url)
+                reserved = False  # the setup task owns the slot now
 
-                logger.info(f"Crawl thread started for domain: {domain}")
-
-                return redirect(url_for('progress', domain=domain))
+                response = redirect(url_for('progress', domain=domain))
+                response.headers['X-DNS-Cache'] = cache_status
+                return response
 
             else:
                 error_msg = f"Verification failed - DNS: {verification.get('dns_valid')}, Socket: {verification.get('socket_valid')}"
                 logger.error(error_msg)
                 DatabaseOperations.insert_log(domain, error_msg, "ERROR")
-                return error_msg, 400
+                return error_msg, 400, {'X-DNS-Cache': cache_status}
 
         except Exception as e:
             logger.exception(f"Error processing request: {e}")
             return f"Internal error: {str(e)}", 500
 
+        finally:
+            # Verification failed or errored before the setup took over: free the slot
+            if reserved:
+                crawl_runner.release()
+
     return render_template('index.html')
 
 
@@ -300,5 +231,9 @@ def dashboard():
 
 
 if __name__ == '__main__':
-    logger.info("Starting Flask application...")
-    app.run(debug=True, host='0.0.0.0', port=5000, threaded=True)
+    # The Werkzeug server is for local development only; production runs under gunicorn
+    if os.getenv('FLASK_ENV') != 'development':
+        raise SystemExit("Run with 'gunicorn -c gunicorn_conf.py app:app' or set FLASK_ENV=development")
+
+    logger.info("Starting Flask development server...")
+    app.run(host='0.0.0.0', port=5000, threaded=True)
@@ -1,19 +1,23 @@
 from celery import Celery
+from celery.signals import worker_process_init
 from config import Config
 import logging
-import subprocess
-import json
+import time
+import crawl_runner
 from operations import DatabaseOperations
 from progress_tracker import ProgressTracker
 
 logger = logging.getLogger(__name__)
 
+Config.validate()
+
 app = Celery('celery_app', broker=Config.CELERY_BROKER_URL, backend=Config.CELERY_RESULT_BACKEND)
 
 app.conf.update(
-    task_serializer='json',
-    result_serializer='json',
-    accept_content=['json'],
+    task_serializer='msgpack',
+    result_serializer='msgpack',
+    accept_content=['msgpack', 'json'],
+    task_ignore_result=True,  # progress lives in Redis via ProgressTracker
     timezone='UTC',
     enable_utc=True,
     task_track_started=True,
@@ -23,11 +27,17 @@ app.conf.update(
     task_acks_late=True,
 )
 
-@app.task(bind=True, name='celery_app.crawl_task')
+@worker_process_init.connect
+def init_crawler_reactor(**kwargs):
+    """Start the in-process Scrapy reactor once per worker process"""
+    crawl_runner.ensure_started()
+
+
+@app.task(bind=True, name='celery_app.crawl_task', ignore_result=True)
 def crawl_task(self, crawl_info):
     """
-    Celery task to run Scrapy spider using subprocess.Popen
-    This avoids the 'daemonic processes are not allowed to have children' error
+    Celery task to run the Scrapy spider in-process via CrawlerRunner.
+    The reactor lives in a background thread, so no child processes are spawned.
     """
     url = crawl_info.get('url')
     domain = crawl_info.get('domain')
@@ -46,69 +56,31 @@ def crawl_task(self, crawl_info):
         tracker.reset()
         tracker.set_total(100)
 
-        # Prepare scrapy command
-        cmd = [
-            'scrapy', 'runspider', 'spider.py',
-            '-a', f'start_url={url}',
-            '-a', f'domain={domain}',
-            '-s', 'ITEM_PIPELINES={"pipelines.PostgreSQLPipeline": 300}',
-            '-s', 'LOG_LEVEL=INFO',
-        ]
-
-        logger.info(f"Executing command: {' '.join(cmd)}")
-        DatabaseOperations.insert_log(domain, f"Executing spider command", "INFO")
-
-        # Run subprocess with proper output handling
-        process = subprocess.Popen(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            bufsize=1,
-            universal_newlines=True
-        )
-
-        # Store process info for monitoring
-        logger.info(f"Spider process started with PID: {process.pid}")
-
-        # Monitor process output in real-time
-        stdout_lines = []
-        stderr_lines = []
-
-        # Read stdout
-        if process.stdout:
-            for line in iter(process.stdout.readline, ''):
-                if not line:
-                    break
-                stdout_lines.append(line.strip())
-                logger.debug(f"Spider output: {line.strip()}")
-
-                # Update task state periodically
-                current_progress = tracker.get_percentage()
-                self.update_state(
-                    state='PROGRESS',
-                    meta={
-                        'progress': current_progress,
-                        'domain': domain,
-                        'status': 'running'
-                    }
-                )
-
-        # Wait for process to complete
-        return_code = process.wait(timeout=3000)  # 50 minutes timeout
-
-        # Read stderr after completion
-        if process.stderr:
-            stderr_output = process.stderr.read()
-            if stderr_output:
-                stderr_lines.append(stderr_output)
-                logger.warning(f"Spider stderr: {stderr_output[:500]}")
+        last_update = [0.0]
+
+        def on_item(item, spider):
+            # Update task state at most once per second while items are scraped
+            now = time.monotonic()
+            if now - last_update[0] < 1.0:
+                return
+            last_update[0] = now
+            self.update_state(
+                state='PROGRESS',
+                meta={
+                    'progress': tracker.get_percentage(),
+                    'domain': domain,
+                    'status': 'running'
+                }
+            )
+
+        DatabaseOperations.insert_log(domain, f"Starting in-process spider", "INFO")
+        finish_reason = crawl_runner.run_crawl(url, domain, on_item=on_item)
 
         # Check result
-        if return_code == 0:
+        if crawl_runner.is_success(finish_reason):
             final_progress = tracker.get_percentage()
             logger.info(f"Crawl completed successfully for {domain}. Progress: {final_progress}%")
-            DatabaseOperations.insert_log(domain, f"Crawl completed successfully", "INFO")
+            DatabaseOperations.finalize_crawl(domain, 'completed', f"Crawl completed successfully", "INFO")
 
             return {
                 'status': 'completed',
@@ -117,50 +89,22 @@ def crawl_task(self, crawl_info):
                 'message': 'Crawl completed successfully'
             }
         else:
-            error_msg = '\n'.join(stderr_lines[-10:]) if stderr_lines else 'Unknown error'
-            logger.error(f"Crawl failed for {domain}: Return code {return_code}")
-            DatabaseOperations.insert_log(domain, f"Crawl failed with code {return_code}: {error_msg[:500]}", "ERROR")
+            error_msg = f"Spider finished with reason {finish_reason}"
+            logger.error(f"Crawl failed for {domain}: {error_msg}")
+            DatabaseOperations.finalize_crawl(domain, 'failed', f"Crawl failed: {error_msg}", "ERROR")
 
             return {
                 'status': 'failed',
                 'progress': 0,
                 'domain': domain,
-                'error': error_msg[:1000],
-                'return_code': return_code
+                'error': error_msg,
+                'finish_reason': finish_reason
             }
 
-    except subprocess.TimeoutExpired:
-        error_msg = "Spider execution timed out after 50 minutes"
-        logger.error(f"{error_msg} for {domain}")
-        DatabaseOperations.insert_log(domain, error_msg, "ERROR")
-
-        # Kill the process
-        if process:
-            process.kill()
-
-        return {
-            'status': 'failed',
-            'progress': 0,
-            'domain': domain,
-            'error': error_msg
-        }
-
-    except FileNotFoundError:
-        error_msg = "Scrapy command not found. Make sure Scrapy is installed and in PATH"
-        logger.error(error_msg)
-        DatabaseOperations.insert_log(domain, error_msg, "ERROR")
-
-        return {
-            'status': 'failed',
-            'progress': 0,
-            'domain': domain,
-            'error': error_msg
-        }
-
     except Exception as e:
         error_msg = str(e)
         logger.error(f"Crawl task failed unexpectedly: {error_msg}")
-        DatabaseOperations.insert_log(domain, f"Task failed: {error_msg[:500]}", "ERROR")
+        DatabaseOperations.finalize_crawl(domain, 'failed', f"Task failed: {error_msg[:500]}", "ERROR")
 
         return {
             'status': 'failed',
@@ -168,12 +112,3 @@ def crawl_task(self, crawl_info):
             'domain': domain,
             'error': error_msg
         }
-
-    finally:
-        # Cleanup
-        if process and process.poll() is None:
-            try:
-                process.terminate()
-                process.wait(timeout=5)
-            except:
-                process.kill()
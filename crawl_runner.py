@@ -0,0 +1,177 @@
+"""
+In-process Scrapy runner shared by the Flask app and the Celery worker
+"""
+
+import asyncio
+import logging
+import threading
+from scrapy import signals
+from scrapy.crawler import CrawlerRunner
+from scrapy.utils.log import configure_logging
+from scrapy.utils.project import get_project_settings
+from scrapy.utils.reactor import install_reactor
+from twisted.internet.defer import DeferredSemaphore
+from config import Config
+from operations import DatabaseOperations
+
+logger = logging.getLogger(__name__)
+
+# Settings that used to be passed to `scrapy runspider` with -s
+CRAWL_SETTINGS = {
+    'ITEM_PIPELINES': {
+        'pipelines.AssetUploadPipeline': 200,
+        'pipelines.PostgreSQLPipeline': 300,
+    },
+    'DOWNLOADER_MIDDLEWARES': {
+        # Close to the downloader, so 429/5xx are seen before RetryMiddleware reschedules them
+        'middlewares.AdaptiveConcurrencyMiddleware': 950,
+    },
+    'LOG_ENABLED': True,
+    'LOG_LEVEL': 'INFO',
+    'TWISTED_REACTOR': 'twisted.internet.asyncioreactor.AsyncioSelectorReactor',
+}
+
+_lock = threading.Lock()
+_runner = None
+_reactor_thread = None
+
+# At most CRAWL_CONCURRENCY spiders run at once per process; the rest wait on the semaphore
+_semaphore = DeferredSemaphore(Config.CRAWL_CONCURRENCY)
+_pending = 0
+_pending_lock = threading.Lock()
+
+
+def _run_reactor(reactor):
+    """Reactor thread entry point"""
+    # The asyncio reactor drives the loop it was installed with
+    asyncio.set_event_loop(reactor._asyncioEventloop)
+    reactor.run(installSignalHandlers=False)
+
+
+def ensure_started():
+    """Install the Twisted reactor and start it in a daemon thread (once per process)"""
+    global _runner, _reactor_thread
+
+    with _lock:
+        if _runner is not None:
+            return _runner
+
+        settings = get_project_settings()
+        settings.setdict(CRAWL_SETTINGS, priority='cmdline')
+
+        install_reactor(settings['TWISTED_REACTOR'])
+        from twisted.internet import reactor
+
+        # Keep our own logging setup, Scrapy only adds its filters/levels
+        configure_logging(settings, install_root_handler=False)
+
+        _runner = CrawlerRunner(settings)
+        _reactor_thread = threading.Thread(
+            target=_run_reactor,
+            args=(reactor,),
+            name='scrapy-reactor',
+            daemon=True
+        )
+        _reactor_thread.start()
+        logger.info("✓ Scrapy reactor started in-process")
+
+        return _runner
+
+
+def pending_crawls():
+    """Number of crawls submitted to this process that have not finished yet"""
+    return _pending
+
+
+def try_reserve():
+    """
+    Claim a crawl slot up front (check and increment in one step), or return False
+    if the queue is full. Pass reserved=True to submit_crawl, or call release().
+    """
+    global _pending
+    with _pending_lock:
+        if _pending >= Config.CRAWL_CONCURRENCY + Config.CRAWL_QUEUE_LIMIT:
+            return False
+        _pending += 1
+        return True
+
+
+def release():
+    """Give back a try_reserve() slot that won't be submitted"""
+    _track_pending(-1)
+
+
+def _track_pending(delta):
+    global _pending
+    with _pending_lock:
+        _pending += delta
+
+
+def is_success(finish_reason):
+    """Whether a spider finish reason counts as a completed crawl"""
+    return bool(finish_reason) and (finish_reason == 'finished' or finish_reason.startswith('closespider_'))
+
+
+def _crawl(url, domain, on_item=None):
+    """Schedule a crawl on the reactor thread; fires with the spider finish reason"""
+    from spider import WebCrawlerSpider
+
+    crawler = _runner.create_crawler(WebCrawlerSpider)
+
+    def item_scraped(item, response, spider):
+        DatabaseOperations.insert_log(domain, f"[{spider.pages_crawled}] Crawled: {item['url']}", "INFO")
+        if on_item:
+            on_item(item, spider)
+
+    crawler.signals.connect(item_scraped, signal=signals.item_scraped, weak=False)
+
+    d = _runner.crawl(crawler, start_url=url, domain=domain)
+    d.addCallback(lambda _: crawler.stats.get_value('finish_reason'))
+    return d
+
+
+def _limited_crawl(url, domain, on_item=None):
+    """Run _crawl once a concurrency slot is free (reactor thread)"""
+    def done(result):
+        _track_pending(-1)
+        return result
+
+    d = _semaphore.run(_crawl, url, domain, on_item)
+    d.addBoth(done)
+    return d
+
+
+def submit_crawl(url, domain, on_finished, on_item=None, reserved=False):
+    """
+    Schedule a crawl from any thread and return immediately.
+    on_finished(finish_reason, error) is called on the reactor thread when the spider closes.
+    With `reserved`, the crawl uses the caller's try_reserve() slot.
+    """
+    ensure_started()
+    from twisted.internet import reactor
+
+    def start():
+        d = _limited_crawl(url, domain, on_item)
+        d.addCallbacks(
+            lambda finish_reason: on_finished(finish_reason, None),
+            lambda failure: on_finished(None, failure.value)
+        )
+        d.addErrback(lambda failure: logger.error(f"Crawl completion handler failed for {domain}: {failure.value}"))
+
+    if not reserved:
+        _track_pending(1)
+    logger.info(f"Scheduling in-process crawl for {url} (domain: {domain}), pending: {_pending}")
+    reactor.callFromThread(start)
+
+
+def run_crawl(url, domain, on_item=None):
+    """
+    Run a crawl in-process and block the calling thread until it finishes.
+    Must not be called from the reactor thread itself.
+    """
+    ensure_started()
+    from twisted.internet import reactor, threads
+
+    _track_pending(1)
+    logger.info(f"Scheduling in-process crawl for {url} (domain: {domain}), pending: {_pending}")
+    return threads.blockingCallFromThread(reactor, _limited_crawl, url, domain, on_item)
@@ -1,5 +1,5 @@
-import psycopg2
-from psycopg2 import pool
+import psycopg
+from psycopg_pool import ConnectionPool
 from threading import Lock
 import logging
 from config import Config
@@ -14,7 +14,7 @@ class DatabaseConfig:
 
     @staticmethod
     def parse_database_url(database_url):
-        """Parse DATABASE_URL into connection parameters"""
+        """Parse DATABASE_URL into psycopg connection keyword arguments"""
         try:
             parsed = urlparse(database_url)
             return {
@@ -22,62 +22,71 @@ class DatabaseConfig:
                 'port': parsed.port or 5432,
                 'dbname': parsed.path[1:] if parsed.path else 'postgres',
                 'user': parsed.username,
-                'password': parsed.password
+                'password': parsed.password,
+                'sslmode': 'require',
+                # Keep idle pooled sockets from being reaped by NAT/load balancers
+                'keepalives': 1,
+                'keepalives_idle': 30
             }
         except Exception as e:
             logger.error(f"Failed to parse DATABASE_URL: {e}")
             raise ValueError(f"Invalid DATABASE_URL format: {e}")
 
+    @staticmethod
+    def connect():
+        """Open a standalone (unpooled) connection, e.g. for migrations"""
+        return psycopg.connect(**_DB_KWARGS)
+
     @staticmethod
     def initialize_pool():
         """Initialize the connection pool from DATABASE_URL"""
         with DatabaseConfig._lock:
             if DatabaseConfig._pool is None:
                 try:
-                    Config.validate()
-
-                    # Parse DATABASE_URL
-                    db_params = DatabaseConfig.parse_database_url(Config.DATABASE_URL)
-
-                    # Create connection pool
-                    DatabaseConfig._pool = pool.SimpleConnectionPool(
-                        minconn=Config.DB_POOL_MIN_CONN,
-                        maxconn=Config.DB_POOL_MAX_CONN,
-                        host=db_params['host'],
-                        port=db_params['port'],
-                        dbname=db_params['dbname'],
-                        user=db_params['user'],
-                        password=db_params['password'],
-                        sslmode='require'
+                    # Create connection pool (thread-safe: Flask threads + crawl reactor share it)
+                    DatabaseConfig._pool = ConnectionPool(
+                        min_size=Config.DB_POOL_MIN_CONN,
+                        max_size=Config.DB_POOL_MAX_CONN,
+                        kwargs=_DB_KWARGS,
+                        name='crawler',
+                        open=True
                     )
-                    logger.info(f"Database pool initialized: {db_params['host']}:{db_params['port']}/{db_params['dbname']}")
+                    logger.info(f"Database pool initialized: {_DB_KWARGS['host']}:{_DB_KWARGS['port']}/{_DB_KWARGS['dbname']} "
+                                f"(minconn={Config.DB_POOL_MIN_CONN}, maxconn={Config.DB_POOL_MAX_CONN}, "
+                                f"web_threads={Config.WEB_THREADS}, celery_concurrency={Config.CELERY_CONCURRENCY})")
+
+                    DatabaseConfig._check_pool_size()
 
                 except Exception as e:
                     logger.error(f"Pool initialization failed: {e}")
                     raise
 
     @staticmethod
-    def get_connection():
-        """Get a connection from the pool"""
-        if DatabaseConfig._pool is None:
-            DatabaseConfig.initialize_pool()
-        try:
-            conn = DatabaseConfig._pool.getconn()
-            logger.debug("Connection acquired from pool")
-            return conn
-        except Exception as e:
-            logger.error(f"Get connection failed: {e}")
-            raise
+    def _check_pool_size():
+        """Refuse a pool that could use more than 80% of the server's max_connections"""
+        with DatabaseConfig._pool.connection() as conn:
+            max_connections = int(conn.execute("SHOW max_connections").fetchone()[0])
+
+        limit = int(max_connections * 0.8)
+        logger.info(f"Postgres max_connections={max_connections}, pool maxconn={Config.DB_POOL_MAX_CONN}")
+        if Config.DB_POOL_MAX_CONN > limit:
+            DatabaseConfig._pool.close()
+            DatabaseConfig._pool = None
+            raise ValueError(
+                f"DB_POOL_MAX_CONN={Config.DB_POOL_MAX_CONN} exceeds 80% of max_connections ({limit}); "
+                f"lower WEB_THREADS/CELERY_CONCURRENCY or use PgBouncer"
+            )
 
     @staticmethod
-    def release_connection(conn):
-        """Return a connection to the pool"""
-        if DatabaseConfig._pool and conn:
-            try:
-                DatabaseConfig._pool.putconn(conn)
-                logger.debug("Connection released to pool")
-            except Exception as e:
-                logger.error(f"Failed to release connection: {e}")
+    def connection():
+        """
+        Borrow a pooled connection as a context manager.
+        The transaction is committed (or rolled back on error) and the
+        connection returned to the pool when the block exits.
+        """
+        if DatabaseConfig._pool is None:
+            DatabaseConfig.initialize_pool()
+        return DatabaseConfig._pool.connection()
 
     @staticmethod
     def close_all():
@@ -85,7 +94,7 @@ class DatabaseConfig:
         with DatabaseConfig._lock:
             if DatabaseConfig._pool:
                 try:
-                    DatabaseConfig._pool.closeall()
+                    DatabaseConfig._pool.close()
                     DatabaseConfig._pool = None
                     logger.info("All database connections closed")
                 except Exception as e:
@@ -94,18 +103,15 @@ class DatabaseConfig:
     @staticmethod
     def test_connection():
         """Test database connection"""
-        conn = None
         try:
-            conn = DatabaseConfig.get_connection()
-            cursor = conn.cursor()
-            cursor.execute("SELECT 1")
-            result = cursor.fetchone()
-            cursor.close()
+            with DatabaseConfig.connection() as conn:
+                result = conn.execute("SELECT 1").fetchone()
             logger.info("Database connection test successful")
             return result[0] == 1
         except Exception as e:
             logger.error(f"Database connection test failed: {e}")
             return False
-        finally:
-            if conn:
-                DatabaseConfig.release_connection(conn)
+
+
+# Parsed once at import; reused by the pool and standalone connections
+_DB_KWARGS = DatabaseConfig.parse_database_url(Config.DATABASE_URL)
@@ -0,0 +1,22 @@
+"""
+Gunicorn configuration: gunicorn -c gunicorn_conf.py app:app
+"""
+
+import os
+from config import Config
+
+bind = os.getenv('BIND', '0.0.0.0:5000')
+
+# Each worker runs its own crawl reactor thread and DB pool
+workers = int(os.getenv('WEB_WORKERS', '2'))
+
+# Threaded workers: gevent would monkey-patch the in-process Scrapy reactor thread
+worker_class = 'gthread'
+threads = Config.WEB_THREADS
+
+keepalive = 30
+timeout = 60
+graceful_timeout = 30
+
+accesslog = '-'
+errorlog = '-'
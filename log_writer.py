@@ -0,0 +1,129 @@
+"""
+Background writer that batches crawl log rows and loads them with COPY.
+Rows land in the UNLOGGED crawl_logs_staging table (no WAL) and are moved
+into crawl_logs every few seconds.
+"""
+
+import atexit
+import logging
+import queue
+import threading
+import time
+from datetime import datetime
+from database import DatabaseConfig
+
+logger = logging.getLogger(__name__)
+
+LOG_QUEUE_SIZE = 10000
+LOG_BATCH_SIZE = 500
+FLUSH_TIMEOUT = 10
+STAGING_MERGE_INTERVAL = 5.0
+
+_COPY_LOGS_SQL = b"COPY crawl_logs_staging (domain, message, level, timestamp) FROM STDIN"
+
+# Concurrent merges are safe: a row deleted by one merge is skipped by the others
+_MERGE_STAGING_SQL = b"""
+    WITH moved AS (
+        DELETE FROM crawl_logs_staging RETURNING *
+    )
+    INSERT INTO crawl_logs SELECT * FROM moved
+"""
+
+_log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+
+
+class LogWriter:
+    _thread = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def start():
+        """Start the writer thread (once per process, lazily so it survives Celery's fork)"""
+        with LogWriter._lock:
+            if LogWriter._thread is not None:
+                return
+            LogWriter._thread = threading.Thread(target=LogWriter._run, name='log-writer', daemon=True)
+            LogWriter._thread.start()
+            # atexit runs LIFO: flush the queue, then merge what was staged
+            atexit.register(LogWriter.merge_staging)
+            atexit.register(LogWriter.flush)
+
+    @staticmethod
+    def put(domain, message, level="INFO", timestamp=None):
+        """Queue a log entry; never blocks the caller"""
+        if LogWriter._thread is None:
+            LogWriter.start()
+        try:
+            # COPY can't apply LEFT(), so this path still truncates client-side
+            _log_queue.put_nowait((domain, message[:2000], level, timestamp or datetime.now()))
+        except queue.Full:
+            logger.warning(f"Log queue full, dropping entry for {domain}")
+
+    @staticmethod
+    def flush(timeout=FLUSH_TIMEOUT):
+        """Block until every entry queued before this call has been written"""
+        if LogWriter._thread is None:
+            return
+        done = threading.Event()
+        try:
+            _log_queue.put(done, timeout=timeout)
+        except queue.Full:
+            logger.warning("Log queue full, flush skipped")
+            return
+        if not done.wait(timeout):
+            logger.warning(f"Log flush did not finish within {timeout}s")
+
+    @staticmethod
+    def merge_staging():
+        """Move staged log rows into crawl_logs"""
+        try:
+            with DatabaseConfig.connection() as conn:
+                moved = conn.execute(_MERGE_STAGING_SQL).rowcount
+            logger.debug(f"Merged {moved} staged log entries")
+        except Exception as e:
+            logger.error(f"Failed to merge staged log entries: {e}")
+
+    @staticmethod
+    def _drain(timeout):
+        """Wait up to `timeout` for the next entry, then take whatever else is queued (up to a batch)"""
+        try:
+            batch = [_log_queue.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        while len(batch) < LOG_BATCH_SIZE:
+            try:
+                batch.append(_log_queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    @staticmethod
+    def _write(rows):
+        try:
+            with DatabaseConfig.connection() as conn, conn.cursor() as cur:
+                with cur.copy(_COPY_LOGS_SQL) as copy:
+                    for row in rows:
+                        copy.write_row(row)
+            logger.debug(f"Wrote {len(rows)} log entries")
+        except Exception as e:
+            logger.error(f"Failed to write {len(rows)} log entries: {e}")
+
+    @staticmethod
+    def _run():
+        staged = False
+        merged_at = time.monotonic()
+        while True:
+            batch = LogWriter._drain(STAGING_MERGE_INTERVAL)
+            # flush() markers are released only after the rows queued before them are written
+            markers = [entry for entry in batch if isinstance(entry, threading.Event)]
+            rows = [entry for entry in batch if not isinstance(entry, threading.Event)]
+            if rows:
+                LogWriter._write(rows)
+                staged = True
+            for marker in markers:
+                marker.set()
+
+            if staged and time.monotonic() - merged_at >= STAGING_MERGE_INTERVAL:
+                LogWriter.merge_staging()
+                staged = False
+                merged_at = time.monotonic()
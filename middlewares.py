@@ -0,0 +1,73 @@
+"""
+Downloader middlewares for the crawler
+"""
+
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Slots grow while their smoothed latency stays under this (seconds)
+TARGET_LATENCY = 1.0
+# Weight of the newest sample in the latency EWMA
+LATENCY_ALPHA = 0.3
+MIN_CONCURRENCY = 1
+
+
+class AdaptiveConcurrencyMiddleware:
+    """
+    AIMD per download slot: +1 concurrent request while the latency EWMA is under
+    TARGET_LATENCY, halved on 429/5xx. Bounded by MIN_CONCURRENCY and CONCURRENT_REQUESTS.
+    Each slot changes at most once per latency window (its EWMA, i.e. about one round
+    trip), so a burst of errors from requests already in flight halves it only once.
+    """
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.max_concurrency = crawler.settings.getint('CONCURRENT_REQUESTS')
+        self._latency = {}
+        self._decreased_at = {}
+        self._increased_at = {}
+
+    def _window(self, key):
+        """Seconds one round trip to the slot takes (TARGET_LATENCY until measured)"""
+        return self._latency.get(key, TARGET_LATENCY)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def process_response(self, request, response, spider):
+        key = request.meta.get('download_slot')
+        slot = self.crawler.engine.downloader.slots.get(key)
+        if slot is None:
+            return response
+
+        now = time.monotonic()
+        window = self._window(key)
+
+        if response.status == 429 or response.status >= 500:
+            if now - self._decreased_at.get(key, float('-inf')) < window:
+                return response
+            concurrency = max(MIN_CONCURRENCY, slot.concurrency // 2)
+            if concurrency != slot.concurrency:
+                self._decreased_at[key] = now
+                logger.info("⚠ %s: HTTP %d, concurrency %d -> %d", key, response.status, slot.concurrency, concurrency)
+                slot.concurrency = concurrency
+            return response
+
+        latency = request.meta.get('download_latency')
+        if latency is None:
+            return response
+
+        ewma = self._latency.get(key)
+        ewma = latency if ewma is None else LATENCY_ALPHA * latency + (1 - LATENCY_ALPHA) * ewma
+        self._latency[key] = ewma
+
+        last_change = max(self._decreased_at.get(key, float('-inf')), self._increased_at.get(key, float('-inf')))
+        if ewma < TARGET_LATENCY and slot.concurrency < self.max_concurrency and now - last_change >= window:
+            self._increased_at[key] = now
+            slot.concurrency += 1
+            logger.debug("%s: latency %.2fs, concurrency -> %d", key, ewma, slot.concurrency)
+
+        return response
@@ -1,82 +1,82 @@
-import psycopg2
-from config import Config
+from database import DatabaseConfig
 import logging
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def migrate_database():
-    """Add missing columns to existing tables"""
-    try:
-        conn = psycopg2.connect(
-            host=Config.DB_HOST,
-            port=Config.DB_PORT,
-            dbname=Config.DB_NAME,
-            user=Config.DB_USER,
-            password=Config.DB_PASSWORD
-        )
-        cursor = conn.cursor()
+# One round trip; every step is guarded so reruns are no-ops
+MIGRATION_SQL = b"""
+    DO $$
+    BEGIN
+        -- Fix 1: Add updated_at to crawl_statistics if missing
+        IF NOT EXISTS (
+            SELECT 1 FROM information_schema.columns
+            WHERE table_name='crawl_statistics' AND column_name='updated_at'
+        ) THEN
+            ALTER TABLE crawl_statistics ADD COLUMN updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
+            RAISE NOTICE 'Added updated_at column to crawl_statistics';
+        END IF;
+
+        -- Fix 2: Add unique constraint on ssl_info.domain if missing
+        IF NOT EXISTS (
+            SELECT 1 FROM pg_constraint
+            WHERE conname = 'ssl_info_domain_key'
+        ) THEN
+            ALTER TABLE ssl_info ADD CONSTRAINT ssl_info_domain_key UNIQUE (domain);
+            RAISE NOTICE 'Added unique constraint on ssl_info.domain';
+        END IF;
 
-        logger.info("Starting database migration...")
+        -- Fix 3: Add updated_at to ssl_info if missing
+        IF NOT EXISTS (
+            SELECT 1 FROM information_schema.columns
+            WHERE table_name='ssl_info' AND column_name='updated_at'
+        ) THEN
+            ALTER TABLE ssl_info ADD COLUMN updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
+            RAISE NOTICE 'Added updated_at column to ssl_info';
+        END IF;
 
-        # Fix 1: Add updated_at to crawl_statistics if missing
-        cursor.execute("""
-            DO $$
-            BEGIN
-                IF NOT EXISTS (
-                    SELECT 1 FROM information_schema.columns
-                    WHERE table_name='crawl_statistics' AND column_name='updated_at'
-                ) THEN
-                    ALTER TABLE crawl_statistics ADD COLUMN updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
-                    RAISE NOTICE 'Added updated_at column to crawl_statistics';
-                END IF;
-            END $$;
-        """)
+        -- Fix 4: One article per page (conflict target for article inserts)
+        IF NOT EXISTS (
+            SELECT 1 FROM pg_indexes
+            WHERE indexname = 'idx_articles_page_id_uniq'
+        ) THEN
+            DELETE FROM articles a USING articles b
+            WHERE a.page_id = b.page_id AND a.id > b.id;
+            CREATE UNIQUE INDEX idx_articles_page_id_uniq ON articles(page_id);
+            DROP INDEX IF EXISTS idx_articles_page_id;
+            RAISE NOTICE 'Added unique index on articles.page_id';
+        END IF;
+    END $$;
 
-        # Fix 2: Add unique constraint on ssl_info.domain if missing
-        cursor.execute("""
-            DO $$
-            BEGIN
-                IF NOT EXISTS (
-                    SELECT 1 FROM pg_constraint
-                    WHERE conname = 'ssl_info_domain_key'
-                ) THEN
-                    ALTER TABLE ssl_info ADD CONSTRAINT ssl_info_domain_key UNIQUE (domain);
-                    RAISE NOTICE 'Added unique constraint on ssl_info.domain';
-                END IF;
-            END $$;
-        """)
+    -- Fix 5: Drop indexes that duplicate the implicit index of a UNIQUE constraint
+    DROP INDEX IF EXISTS idx_ssl_info_domain;
+    DROP INDEX IF EXISTS idx_crawled_pages_url;
+    DROP INDEX IF EXISTS idx_crawl_statistics_domain;
+"""
 
-        # Fix 3: Create unique index if not exists
-        cursor.execute("""
-            CREATE UNIQUE INDEX IF NOT EXISTS idx_ssl_info_domain ON ssl_info(domain);
-        """)
 
-        # Fix 4: Add updated_at to ssl_info if missing
-        cursor.execute("""
-            DO $$
-            BEGIN
-                IF NOT EXISTS (
-                    SELECT 1 FROM information_schema.columns
-                    WHERE table_name='ssl_info' AND column_name='updated_at'
-                ) THEN
-                    ALTER TABLE ssl_info ADD COLUMN updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
-                    RAISE NOTICE 'Added updated_at column to ssl_info';
-                END IF;
-            END $$;
-        """)
+def migrate_database(conn=None):
+    """
+    Add missing columns to existing tables.
+    With a connection the migration joins the caller's transaction;
+    otherwise it opens its own connection and commits.
+    """
+    if conn is not None:
+        conn.execute(MIGRATION_SQL)
+        logger.info("✓ Database migration applied")
+        return
 
-        conn.commit()
+    try:
+        with DatabaseConfig.connect() as own_conn:
+            logger.info("Starting database migration...")
+            with own_conn.transaction():
+                own_conn.execute(MIGRATION_SQL)
         logger.info("✅ Database migration completed successfully!")
 
     except Exception as e:
         logger.error(f"❌ Migration failed: {e}")
-        conn.rollback()
         raise
-    finally:
-        if conn:
-            cursor.close()
-            conn.close()
+
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     migrate_database()
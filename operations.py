@@ -1,233 +1,451 @@
+import atexit
 import logging
+import os
+import threading
+import time
+import msgpack
+import redis
+from contextlib import ExitStack
 from datetime import datetime
+from email.utils import parsedate_to_datetime
+from config import Config
 from database import DatabaseConfig
-from psycopg2.extras import execute_batch
+from log_writer import LogWriter
+from migrate_database import migrate_database
 
 logger = logging.getLogger(__name__)
 
+# Short-lived Redis cache for crawl_statistics rows polled by /get_progress
+STATS_CACHE_TTL = 5
+_stats_redis = None
+
+
+def _stats_cache():
+    """Lazily create the Redis client used for the statistics cache"""
+    global _stats_redis
+    if _stats_redis is None:
+        _stats_redis = redis.from_url(Config.REDIS_URL)
+    return _stats_redis
+
+
+def _stats_key(domain):
+    return f"stats:{domain}"
+
+
+# Cached rows are msgpack (never pickle: the cache is shared); timestamps travel as ISO strings
+_DATETIME_EXT = 1
+
+
+def _encode_ext(value):
+    if isinstance(value, datetime):
+        return msgpack.ExtType(_DATETIME_EXT, value.isoformat().encode())
+    raise TypeError(f"Cannot cache value of type {type(value).__name__}")
+
+
+def _decode_ext(code, data):
+    if code == _DATETIME_EXT:
+        return datetime.fromisoformat(data.decode())
+    return msgpack.ExtType(code, data)
+
+
+def _pack_row(row):
+    return msgpack.packb(list(row), default=_encode_ext)
+
+
+def _unpack_row(data):
+    return tuple(msgpack.unpackb(data, ext_hook=_decode_ext))
+
+
+def _invalidate_stats(domains):
+    try:
+        _stats_cache().delete(*[_stats_key(domain) for domain in domains])
+    except Exception as e:
+        logger.warning(f"Failed to invalidate cached statistics for {', '.join(domains)}: {e}")
+
+
+# Queued statistics upserts are synced after this many calls or seconds
+STATS_SYNC_EVERY = 100
+STATS_SYNC_INTERVAL = 1.0
+# Statuses that end a crawl; updates setting them are synced at once
+TERMINAL_STATUSES = frozenset({'completed', 'failed'})
+
+
+# Advisory lock key guarding schema creation across web/worker processes
+SCHEMA_LOCK_ID = 8372619
+# Bump whenever schema.sql or MIGRATION_SQL changes, so running databases pick it up
+SCHEMA_VERSION = 1
+
+_SELECT_SCHEMA_VERSION_SQL = b"SELECT version FROM schema_version"
+
+_UPSERT_SCHEMA_VERSION_SQL = b"""
+    INSERT INTO schema_version (version) VALUES (%s)
+    ON CONFLICT (id) DO UPDATE SET version = EXCLUDED.version, updated_at = CURRENT_TIMESTAMP
+"""
+
+# Whole schema bootstrap, read once at import and sent as one multi-statement batch
+with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'schema.sql'), 'rb') as _schema_file:
+    SCHEMA_SQL = _schema_file.read()
+
+# Statement text is kept constant (and pre-encoded as bytes) so psycopg reuses one
+# server-side prepared statement per pooled connection (execute(..., prepare=True)).
+# Note: prepared statements need session (not transaction) pooling if PgBouncer is used.
+_UPSERT_SSL_INFO_SQL = b"""
+    INSERT INTO ssl_info (domain, provider, expiry_date, updated_at)
+    VALUES (%s, %s, %s, CURRENT_TIMESTAMP)
+    ON CONFLICT (domain) DO UPDATE SET
+        provider = EXCLUDED.provider,
+        expiry_date = EXCLUDED.expiry_date,
+        updated_at = CURRENT_TIMESTAMP
+"""
+
+_INSERT_PAGE_SQL = b"""
+    INSERT INTO crawled_pages (url, domain, title, content, status_code, content_type)
+    VALUES (%s, %s, %s, %s, %s, %s)
+    ON CONFLICT (url) DO UPDATE SET
+        title = EXCLUDED.title,
+        content = EXCLUDED.content,
+        status_code = EXCLUDED.status_code,
+        content_type = EXCLUDED.content_type,
+        crawled_at = CURRENT_TIMESTAMP
+    RETURNING id
+"""
+
+# Batches are sent as arrays and expanded server-side: one statement per batch, whatever its size
+_INSERT_METADATA_SQL = b"""
+    INSERT INTO page_metadata (page_id, meta_key, meta_value)
+    SELECT %s, t.key, LEFT(t.value, 1000)
+    FROM UNNEST(%s::text[], %s::text[]) AS t(key, value)
+"""
+
+_INSERT_METADATA_BY_URL_SQL = b"""
+    INSERT INTO page_metadata (page_id, meta_key, meta_value)
+    SELECT p.id, t.key, LEFT(t.value, 1000)
+    FROM crawled_pages p, UNNEST(%s::text[], %s::text[]) AS t(key, value)
+    WHERE p.url = %s
+"""
+
+# Payload-free assets only; rows with content go through _COPY_ASSETS_SQL
+_INSERT_ASSET_SQL = b"""
+    INSERT INTO assets (page_id, type, url, file_size, cloud_url)
+    SELECT %s, t.type, t.url, t.file_size, t.cloud_url
+    FROM UNNEST(%s::text[], %s::text[], %s::int4[], %s::text[]) AS t(type, url, file_size, cloud_url)
+"""
+
+_INSERT_ASSET_BY_URL_SQL = b"""
+    INSERT INTO assets (page_id, type, url, file_size, cloud_url)
+    SELECT p.id, t.type, t.url, t.file_size, t.cloud_url
+    FROM crawled_pages p,
+         UNNEST(%s::text[], %s::text[], %s::int4[], %s::text[]) AS t(type, url, file_size, cloud_url)
+    WHERE p.url = %s
+"""
+
+_COPY_ASSETS_SQL = b"COPY assets (page_id, type, url, content, file_size, cloud_url) FROM STDIN WITH (FORMAT BINARY)"
+_COPY_ASSETS_TYPES = ['int4', 'text', 'text', 'bytea', 'int4', 'text']
+
+_INSERT_ARTICLE_SQL = b"""
+    INSERT INTO articles (page_id, headline, author, published_date, article_text)
+    VALUES (%s, %s, %s, %s, %s)
+    ON CONFLICT (page_id) DO NOTHING
+"""
+
+_INSERT_ARTICLE_BY_URL_SQL = b"""
+    INSERT INTO articles (page_id, headline, author, published_date, article_text)
+    VALUES ((SELECT id FROM crawled_pages WHERE url = %s), %s, %s, %s, %s)
+    ON CONFLICT (page_id) DO NOTHING
+"""
+
+_INSERT_LOG_SQL = b"""
+    INSERT INTO crawl_logs (domain, message, level)
+    VALUES (%s, LEFT(%s::text, 2000), %s)
+"""
+
+_UPSERT_STATS_SQL = b"""
+    INSERT INTO crawl_statistics (domain, total_pages, total_assets, status, start_time, end_time, updated_at)
+    VALUES (%s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP)
+    ON CONFLICT (domain) DO UPDATE SET
+        total_pages = COALESCE(EXCLUDED.total_pages, crawl_statistics.total_pages),
+        total_assets = COALESCE(EXCLUDED.total_assets, crawl_statistics.total_assets),
+        status = COALESCE(EXCLUDED.status, crawl_statistics.status),
+        start_time = COALESCE(EXCLUDED.start_time, crawl_statistics.start_time),
+        end_time = COALESCE(EXCLUDED.end_time, crawl_statistics.end_time),
+        updated_at = CURRENT_TIMESTAMP
+"""
+
+# Latest upload of each asset URL, so restarts and re-crawls don't re-upload to Cloudinary
+_SELECT_UPLOADED_ASSETS_SQL = b"""
+    SELECT DISTINCT ON (url) url, cloud_url, file_size
+    FROM assets
+    WHERE url = ANY(%s::text[]) AND cloud_url IS NOT NULL
+    ORDER BY url, id DESC
+"""
+
+_SELECT_STATS_SQL = b"""
+    SELECT id, domain, total_pages, total_assets, status, start_time, end_time, updated_at
+    FROM crawl_statistics
+    WHERE domain = %s
+"""
+
+_SELECT_RECENT_LOGS_SQL = b"""
+    SELECT timestamp, level, message FROM (
+        (SELECT timestamp, level, message FROM crawl_logs
+         WHERE domain = %(domain)s ORDER BY timestamp DESC LIMIT %(limit)s)
+        UNION ALL
+        (SELECT timestamp, level, message FROM crawl_logs_staging
+         WHERE domain = %(domain)s ORDER BY timestamp DESC LIMIT %(limit)s)
+    ) AS recent
+    ORDER BY timestamp DESC LIMIT %(limit)s
+"""
+
+
+def _metadata_arrays(metadata_dict):
+    return list(metadata_dict.keys()), list(metadata_dict.values())
+
+
+def _published_date(value):
+    """
+    A page-supplied publish date (ISO 8601 or RFC 2822) as a datetime, or None.
+    Parsed here so an unparseable date drops only itself, not the page's whole transaction.
+    """
+    if not value or isinstance(value, datetime):
+        return value or None
+    value = value.strip()
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        pass
+    try:
+        return parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _asset_arrays(assets):
+    return (
+        [asset['type'] for asset in assets],
+        [asset['url'] for asset in assets],
+        [asset.get('file_size') for asset in assets],
+        [asset.get('cloud_url') for asset in assets],
+    )
+
+
+class _StatsWriter:
+    """
+    Statistics upserts on a pooled connection, reserved for stats and kept in
+    autocommit pipeline mode.
+    Each update is queued and returns immediately; the server acks are collected
+    on the next sync (every STATS_SYNC_EVERY calls, or by a background thread
+    within STATS_SYNC_INTERVAL seconds, so no upsert holds its row lock for long).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stack = None
+        self._conn = None
+        self._pipeline = None
+        self._pending = 0
+        self._domains = set()
+        self._synced_at = time.monotonic()
+        self._thread = None
+        atexit.register(self.sync)
+
+    def _start(self):
+        """Start the sync thread (lazily, so it survives Celery's fork)"""
+        self._thread = threading.Thread(target=self._run, name='stats-sync', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(STATS_SYNC_INTERVAL)
+            self.sync()
+
+    def _open(self):
+        stack = ExitStack()
+        conn = stack.enter_context(DatabaseConfig.connection())
+        conn.autocommit = True
+        # Unwound LIFO: leave pipeline mode, restore the pool's default, then give the connection back
+        stack.callback(setattr, conn, 'autocommit', False)
+        pipeline = stack.enter_context(conn.pipeline())
+        self._stack, self._conn, self._pipeline = stack, conn, pipeline
+
+    def _close(self):
+        stack, self._stack, self._conn, self._pipeline = self._stack, None, None, None
+        self._pending = 0
+        self._domains.clear()
+        try:
+            stack.close()
+        except Exception as e:
+            logger.debug(f"Closing statistics connection failed: {e}")
+
+    def _sync(self):
+        self._pipeline.sync()
+        domains = list(self._domains)
+        self._pending = 0
+        self._domains.clear()
+        self._synced_at = time.monotonic()
+        if domains:
+            _invalidate_stats(domains)
+
+    def execute(self, params, sync=False):
+        """Queue one upsert; sync right away when `sync` is set or a flush is due"""
+        with self._lock:
+            if self._thread is None:
+                self._start()
+            try:
+                if self._conn is None:
+                    self._open()
+                self._conn.execute(_UPSERT_STATS_SQL, params, prepare=True)
+                self._pending += 1
+                self._domains.add(params[0])
+                if sync or self._pending >= STATS_SYNC_EVERY or \
+                        time.monotonic() - self._synced_at >= STATS_SYNC_INTERVAL:
+                    self._sync()
+            except Exception:
+                # A failed pipeline can't be reused; later updates supersede the lost ones
+                if self._conn is not None:
+                    self._close()
+                raise
+
+    def sync(self):
+        """Wait for every queued upsert to be acknowledged"""
+        with self._lock:
+            if self._conn is None or not self._pending:
+                return
+            try:
+                self._sync()
+            except Exception as e:
+                logger.error(f"Failed to sync statistics: {e}")
+                self._close()
+
+
+_stats_writer = _StatsWriter()
+
 
 class DatabaseOperations:
     datetime = datetime  # Make datetime accessible for app.py
 
+    @staticmethod
+    def _schema_current(cur):
+        """Whether the database already has SCHEMA_VERSION (reads only; takes no table locks)"""
+        cur.execute("SELECT to_regclass('schema_version') IS NOT NULL")
+        if not cur.fetchone()[0]:
+            return False
+        cur.execute(_SELECT_SCHEMA_VERSION_SQL)
+        row = cur.fetchone()
+        return row is not None and row[0] >= SCHEMA_VERSION
+
     @staticmethod
     def initialize_database():
-        """Initialize database tables if they don't exist"""
-        conn = None
+        """Initialize database tables if they don't exist (one process at a time, the rest wait)"""
         try:
-            conn = DatabaseConfig.get_connection()
-            cursor = conn.cursor()
-
-            # Crawl logs table
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS crawl_logs (
-                    id SERIAL PRIMARY KEY,
-                    domain TEXT NOT NULL,
-                    message TEXT NOT NULL,
-                    level TEXT NOT NULL,
-                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_crawl_logs_domain ON crawl_logs(domain)")
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_crawl_logs_timestamp ON crawl_logs(timestamp)")
-
-            # Crawled pages table
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS crawled_pages (
-                    id SERIAL PRIMARY KEY,
-                    url TEXT UNIQUE NOT NULL,
-                    domain TEXT NOT NULL,
-                    title TEXT,
-                    content TEXT,
-                    status_code INTEGER,
-                    content_type TEXT,
-                    crawled_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_crawled_pages_domain ON crawled_pages(domain)")
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_crawled_pages_url ON crawled_pages(url)")
-
-            # Page metadata table
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS page_metadata (
-                    id SERIAL PRIMARY KEY,
-                    page_id INTEGER REFERENCES crawled_pages(id) ON DELETE CASCADE,
-                    meta_key TEXT NOT NULL,
-                    meta_value TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_page_metadata_page_id ON page_metadata(page_id)")
-
-            # Assets table
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS assets (
-                    id SERIAL PRIMARY KEY,
-                    page_id INTEGER REFERENCES crawled_pages(id) ON DELETE CASCADE,
-                    type TEXT NOT NULL,
-                    url TEXT NOT NULL,
-                    content BYTEA,
-                    file_size INTEGER,
-                    cloud_url TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_assets_page_id ON assets(page_id)")
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_assets_type ON assets(type)")
-
-            # Articles table
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS articles (
-                    id SERIAL PRIMARY KEY,
-                    page_id INTEGER REFERENCES crawled_pages(id) ON DELETE CASCADE,
-                    headline TEXT,
-                    author TEXT,
-                    published_date TIMESTAMP,
-                    article_text TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_articles_page_id ON articles(page_id)")
-
-            # Crawl statistics table
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS crawl_statistics (
-                    id SERIAL PRIMARY KEY,
-                    domain TEXT UNIQUE NOT NULL,
-                    total_pages INTEGER DEFAULT 0,
-                    total_assets INTEGER DEFAULT 0,
-                    status TEXT DEFAULT 'pending',
-                    start_time TIMESTAMP,
-                    end_time TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_crawl_statistics_domain ON crawl_statistics(domain)")
-
-            # SSL info table
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS ssl_info (
-                    id SERIAL PRIMARY KEY,
-                    domain TEXT UNIQUE NOT NULL,
-                    provider TEXT,
-                    expiry_date TIMESTAMP,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_ssl_info_domain ON ssl_info(domain)")
+            with DatabaseConfig.connection() as conn, conn.cursor() as cur:
+                # Even IF NOT EXISTS DDL locks its tables, so a current schema is left alone
+                if DatabaseOperations._schema_current(cur):
+                    logger.info("Database schema is current, skipping DDL")
+                    return
+
+                # Wait for any other process's bootstrap to commit (released with the transaction),
+                # then check again: it has usually just brought the schema up to date
+                cur.execute("SELECT pg_advisory_xact_lock(%s)", (SCHEMA_LOCK_ID,))
+                if DatabaseOperations._schema_current(cur):
+                    logger.info("Database schema initialized by another process, skipping DDL")
+                    return
+
+                cur.execute(SCHEMA_SQL)
+
+                # Bring older schemas up to date in the same transaction
+                migrate_database(conn)
+                cur.execute(_UPSERT_SCHEMA_VERSION_SQL, (SCHEMA_VERSION,))
 
-            conn.commit()
             logger.info("Database schema initialized successfully (preserving existing data)")
 
         except Exception as e:
             logger.error(f"Database initialization failed: {e}")
-            if conn:
-                conn.rollback()
             raise
 
-        finally:
-            if conn:
-                cursor.close()
-                DatabaseConfig.release_connection(conn)
-
     @staticmethod
     def insert_ssl_info(domain, provider, expiry_date):
         """Insert or update SSL information for a domain"""
-        conn = None
         try:
-            conn = DatabaseConfig.get_connection()
-            cursor = conn.cursor()
-
-            cursor.execute("""
-                INSERT INTO ssl_info (domain, provider, expiry_date, updated_at)
-                VALUES (%s, %s, %s, CURRENT_TIMESTAMP)
-                ON CONFLICT (domain) DO UPDATE SET
-                    provider = EXCLUDED.provider,
-                    expiry_date = EXCLUDED.expiry_date,
-                    updated_at = CURRENT_TIMESTAMP
-            """, (domain, provider, expiry_date))
-
-            conn.commit()
+            with DatabaseConfig.connection() as conn, conn.cursor() as cur:
+                cur.execute(_UPSERT_SSL_INFO_SQL, (domain, provider, expiry_date), prepare=True)
+
             logger.info(f"SSL info saved for domain: {domain}")
             return True
 
         except Exception as e:
             logger.error(f"SSL insert failed for {domain}: {e}")
-            if conn:
-                conn.rollback()
             return False
 
-        finally:
-            if conn:
-                cursor.close()
-                DatabaseConfig.release_connection(conn)
+    @staticmethod
+    def _page(cur, url, domain, title=None, content=None, status_code=None, content_type=None):
+        """Upsert a crawled page on an existing cursor (no commit); returns its id"""
+        cur.execute(_INSERT_PAGE_SQL, (url, domain, title, content, status_code, content_type), prepare=True)
+        result = cur.fetchone()
+        return result[0] if result else None
+
+    @staticmethod
+    def _metadata(cur, page_id, metadata_dict):
+        """Insert page metadata on an existing cursor (no commit); returns the row count"""
+        cur.execute(_INSERT_METADATA_SQL, (page_id, *_metadata_arrays(metadata_dict)), prepare=True)
+        return len(metadata_dict)
+
+    @staticmethod
+    def _assets(cur, page_id, assets):
+        """Insert page assets on an existing cursor (no commit); returns the row count"""
+        if any(asset.get('content') is not None for asset in assets):
+            # Binary COPY sends BYTEA payloads as raw bytes instead of hex-escaped parameters
+            with cur.copy(_COPY_ASSETS_SQL) as copy:
+                copy.set_types(_COPY_ASSETS_TYPES)
+                for asset in assets:
+                    copy.write_row((page_id, asset['type'], asset['url'], asset.get('content'),
+                                    asset.get('file_size'), asset.get('cloud_url')))
+        else:
+            cur.execute(_INSERT_ASSET_SQL, (page_id, *_asset_arrays(assets)), prepare=True)
+        return len(assets)
+
+    @staticmethod
+    def _article(cur, page_id, headline, author, published_date, article_text):
+        """Insert article content on an existing cursor (no commit)"""
+        cur.execute(_INSERT_ARTICLE_SQL, (page_id, headline, author, _published_date(published_date), article_text),
+                    prepare=True)
+
+    @staticmethod
+    def save_item(item):
+        """
+        Write a crawled page with its metadata, assets and article in one transaction.
+        Returns the page id (None if the page row was not written); raises on database errors.
+        """
+        with Db() as db:
+            return db.save_item(item)
 
     @staticmethod
     def insert_page(url, domain, title=None, content=None, status_code=None, content_type=None):
         """Insert or update a crawled page"""
-        conn = None
         try:
-            conn = DatabaseConfig.get_connection()
-            cursor = conn.cursor()
-
-            cursor.execute("""
-                INSERT INTO crawled_pages (url, domain, title, content, status_code, content_type)
-                VALUES (%s, %s, %s, %s, %s, %s)
-                ON CONFLICT (url) DO UPDATE SET
-                    title = EXCLUDED.title,
-                    content = EXCLUDED.content,
-                    status_code = EXCLUDED.status_code,
-                    content_type = EXCLUDED.content_type,
-                    crawled_at = CURRENT_TIMESTAMP
-                RETURNING id
-            """, (url, domain, title, content, status_code, content_type))
-
-            result = cursor.fetchone()
-            conn.commit()
-            page_id = result[0] if result else None
+            with Db() as db:
+                page_id = db.page(url, domain, title, content, status_code, content_type)
+
             logger.info(f"Page inserted/updated: {url} (ID: {page_id})")
             return page_id
 
         except Exception as e:
             logger.error(f"Failed to insert page {url}: {e}")
-            if conn:
-                conn.rollback()
             return None
 
-        finally:
-            if conn:
-                cursor.close()
-                DatabaseConfig.release_connection(conn)
-
     @staticmethod
     def insert_metadata_batch(page_id, metadata_dict):
         """Insert metadata for a page in batch"""
         if not metadata_dict:
             return
 
-        conn = None
         try:
-            conn = DatabaseConfig.get_connection()
-            cursor = conn.cursor()
+            with Db() as db:
+                count = db.metadata(page_id, metadata_dict)
 
-            data = [(page_id, key, str(value)[:1000]) for key, value in metadata_dict.items()]
-            execute_batch(cursor, """
-                INSERT INTO page_metadata (page_id, meta_key, meta_value)
-                VALUES (%s, %s, %s)
-            """, data, page_size=100)
-
-            conn.commit()
-            logger.info(f"Inserted {len(data)} metadata entries for page_id: {page_id}")
+            logger.info(f"Inserted {count} metadata entries for page_id: {page_id}")
 
         except Exception as e:
             logger.error(f"Failed to insert metadata batch: {e}")
-            if conn:
-                conn.rollback()
-
-        finally:
-            if conn:
-                cursor.close()
-                DatabaseConfig.release_connection(conn)
 
     @staticmethod
     def insert_asset_batch(page_id, assets):
@@ -235,169 +453,204 @@ class DatabaseOperations:
         if not assets:
             return
 
-        conn = None
         try:
-            conn = DatabaseConfig.get_connection()
-            cursor = conn.cursor()
+            with Db() as db:
+                count = db.assets(page_id, assets)
 
-            data = [
-                (page_id, asset['type'], asset['url'], asset.get('content'),
-                 asset.get('file_size'), asset.get('cloud_url'))
-                for asset in assets
-            ]
-
-            execute_batch(cursor, """
-                INSERT INTO assets (page_id, type, url, content, file_size, cloud_url)
-                VALUES (%s, %s, %s, %s, %s, %s)
-            """, data, page_size=50)
-
-            conn.commit()
-            logger.info(f"Inserted {len(data)} assets for page_id: {page_id}")
+            logger.info(f"Inserted {count} assets for page_id: {page_id}")
 
         except Exception as e:
             logger.error(f"Failed to insert asset batch: {e}")
-            if conn:
-                conn.rollback()
-
-        finally:
-            if conn:
-                cursor.close()
-                DatabaseConfig.release_connection(conn)
 
     @staticmethod
     def insert_article(page_id, headline, author, published_date, article_text):
         """Insert article content"""
-        if not headline and not article_text:
+        if not page_id or (not headline and not article_text):
             return
 
-        conn = None
         try:
-            conn = DatabaseConfig.get_connection()
-            cursor = conn.cursor()
-
-            cursor.execute("""
-                INSERT INTO articles (page_id, headline, author, published_date, article_text)
-                VALUES (%s, %s, %s, %s, %s)
-                ON CONFLICT DO NOTHING
-            """, (page_id, headline, author, published_date, article_text))
+            with Db() as db:
+                db.article(page_id, headline, author, published_date, article_text)
 
-            conn.commit()
             logger.info(f"Article inserted for page_id: {page_id}")
 
         except Exception as e:
             logger.error(f"Failed to insert article: {e}")
-            if conn:
-                conn.rollback()
-
-        finally:
-            if conn:
-                cursor.close()
-                DatabaseConfig.release_connection(conn)
 
     @staticmethod
     def insert_log(domain, message, level):
-        """Insert a log entry"""
-        conn = None
-        try:
-            conn = DatabaseConfig.get_connection()
-            cursor = conn.cursor()
+        """Queue a log entry; LogWriter loads queued entries in batches with COPY"""
+        LogWriter.put(domain, message, level)
 
-            cursor.execute("""
-                INSERT INTO crawl_logs (domain, message, level)
-                VALUES (%s, %s, %s)
-            """, (domain, str(message)[:2000], level))
-
-            conn.commit()
-
-        except Exception as e:
-            logger.error(f"Failed to insert log: {e}")
-            if conn:
-                conn.rollback()
-
-        finally:
-            if conn:
-                cursor.close()
-                DatabaseConfig.release_connection(conn)
+    @staticmethod
+    def flush_log_staging():
+        """Write queued log entries and move everything staged into crawl_logs"""
+        LogWriter.flush()
+        LogWriter.merge_staging()
 
     @staticmethod
     def update_crawl_statistics(domain, total_pages=None, total_assets=None, status=None,
                                 start_time=None, end_time=None):
-        """Update crawl statistics for a domain"""
-        conn = None
+        """
+        Update crawl statistics for a domain (queued, not awaited).
+        Terminal statuses (and anything setting end_time) are synced immediately;
+        the rest are acked by the writer's sync thread within STATS_SYNC_INTERVAL.
+        """
         try:
-            conn = DatabaseConfig.get_connection()
-            cursor = conn.cursor()
-
-            cursor.execute("""
-                INSERT INTO crawl_statistics (domain, total_pages, total_assets, status, start_time, end_time, updated_at)
-                VALUES (%s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP)
-                ON CONFLICT (domain) DO UPDATE SET
-                    total_pages = COALESCE(EXCLUDED.total_pages, crawl_statistics.total_pages),
-                    total_assets = COALESCE(EXCLUDED.total_assets, crawl_statistics.total_assets),
-                    status = COALESCE(EXCLUDED.status, crawl_statistics.status),
-                    start_time = COALESCE(EXCLUDED.start_time, crawl_statistics.start_time),
-                    end_time = COALESCE(EXCLUDED.end_time, crawl_statistics.end_time),
-                    updated_at = CURRENT_TIMESTAMP
-            """, (domain, total_pages, total_assets, status, start_time, end_time))
-
-            conn.commit()
-            logger.info(f"Statistics updated for domain: {domain}")
+            _stats_writer.execute(
+                (domain, total_pages, total_assets, status, start_time, end_time),
+                sync=status in TERMINAL_STATUSES or end_time is not None
+            )
+            logger.debug(f"Statistics queued for domain: {domain}")
 
         except Exception as e:
             logger.error(f"Failed to update statistics: {e}")
-            if conn:
-                conn.rollback()
 
-        finally:
-            if conn:
-                cursor.close()
-                DatabaseConfig.release_connection(conn)
+    @staticmethod
+    def finalize_crawl(domain, status, message, level="INFO", end_time=None,
+                       total_pages=None, total_assets=None):
+        """Record the final crawl status and its log entry in a single transaction"""
+        # Land queued running-status updates first so they can't overwrite the final row
+        _stats_writer.sync()
+        try:
+            with DatabaseConfig.connection() as conn, conn.cursor() as cur:
+                cur.execute(_UPSERT_STATS_SQL,
+                            (domain, total_pages, total_assets, status, None, end_time or datetime.now()),
+                            prepare=True)
+                cur.execute(_INSERT_LOG_SQL, (domain, message, level), prepare=True)
+
+            logger.info(f"Crawl finalized for domain: {domain} ({status})")
+            _invalidate_stats([domain])
+
+        except Exception as e:
+            logger.error(f"Failed to finalize crawl for {domain}: {e}")
 
     @staticmethod
     def get_crawl_statistics(domain):
-        """Get crawl statistics for a domain"""
-        conn = None
+        """Get crawl statistics for a domain (cached in Redis for a few seconds)"""
         try:
-            conn = DatabaseConfig.get_connection()
-            cursor = conn.cursor()
+            cached = _stats_cache().get(_stats_key(domain))
+            if cached is not None:
+                return _unpack_row(cached)
+        except Exception as e:
+            logger.warning(f"Statistics cache read failed for {domain}: {e}")
 
-            cursor.execute("""
-                SELECT id, domain, total_pages, total_assets, status, start_time, end_time, updated_at
-                FROM crawl_statistics
-                WHERE domain = %s
-            """, (domain,))
+        try:
+            with DatabaseConfig.connection() as conn, conn.cursor() as cur:
+                cur.execute(_SELECT_STATS_SQL, (domain,), prepare=True)
+                row = cur.fetchone()
 
-            return cursor.fetchone()
+            if row is not None:
+                try:
+                    _stats_cache().setex(_stats_key(domain), STATS_CACHE_TTL, _pack_row(row))
+                except Exception as e:
+                    logger.warning(f"Statistics cache write failed for {domain}: {e}")
+            return row
 
         except Exception as e:
             logger.error(f"Get statistics failed for {domain}: {e}")
             return None
 
-        finally:
-            if conn:
-                cursor.close()
-                DatabaseConfig.release_connection(conn)
+    @staticmethod
+    def get_uploaded_assets(urls):
+        """Map asset URL -> {cloud_url, file_size} for URLs already uploaded by any crawl"""
+        try:
+            with DatabaseConfig.connection() as conn, conn.cursor() as cur:
+                cur.execute(_SELECT_UPLOADED_ASSETS_SQL, (list(urls),), prepare=True)
+                return {url: {'cloud_url': cloud_url, 'file_size': file_size}
+                        for url, cloud_url, file_size in cur}
+
+        except Exception as e:
+            logger.error(f"Failed to look up uploaded assets: {e}")
+            return {}
 
     @staticmethod
     def get_recent_logs(domain, limit=50):
         """Get recent logs for a domain"""
-        conn = None
         try:
-            conn = DatabaseConfig.get_connection()
-            cursor = conn.cursor()
-
-            cursor.execute("""
-                SELECT timestamp, level, message FROM crawl_logs
-                WHERE domain = %s ORDER BY timestamp DESC LIMIT %s
-            """, (domain, limit))
-
-            return cursor.fetchall()
+            with DatabaseConfig.connection() as conn, conn.cursor() as cur:
+                cur.execute(_SELECT_RECENT_LOGS_SQL, {'domain': domain, 'limit': limit}, prepare=True)
+                return cur.fetchall()
 
         except Exception as e:
             logger.error(f"Failed to get logs for {domain}: {e}")
             return []
 
+
+class Db:
+    """
+    A pooled connection and its cursors, checked out once for a unit of work:
+
+        with Db() as db:
+            db.save_item(item)
+
+    The transaction is committed and the connection returned to the pool on exit.
+    """
+
+    def __enter__(self):
+        self._checkout = DatabaseConfig.connection()
+        self.conn = self._checkout.__enter__()
+        self.cur = self.conn.cursor()
+        # Second cursor so RETURNING id can be read after the child inserts are queued
+        self._page_cur = self.conn.cursor()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self._page_cur.close()
+            self.cur.close()
         finally:
-            if conn:
-                cursor.close()
-                DatabaseConfig.release_connection(conn)
+            return self._checkout.__exit__(exc_type, exc, tb)
+
+    def page(self, url, domain, title=None, content=None, status_code=None, content_type=None):
+        return DatabaseOperations._page(self.cur, url, domain, title, content, status_code, content_type)
+
+    def metadata(self, page_id, metadata_dict):
+        return DatabaseOperations._metadata(self.cur, page_id, metadata_dict) if metadata_dict else 0
+
+    def assets(self, page_id, assets):
+        return DatabaseOperations._assets(self.cur, page_id, assets) if assets else 0
+
+    def article(self, page_id, headline, author, published_date, article_text):
+        if page_id and (headline or article_text):
+            DatabaseOperations._article(self.cur, page_id, headline, author, published_date, article_text)
+
+    def save_item(self, item):
+        """Write a page with its metadata, assets and article; returns the page id"""
+        url = item['url']
+        assets = item.get('assets') or []
+        # Payload-carrying assets go through binary COPY, which needs the id and can't be pipelined
+        copy_assets = any(asset.get('content') is not None for asset in assets)
+
+        # Child rows look the page up by url, so they are sent without waiting for RETURNING id
+        with self.conn.pipeline():
+            self._page_cur.execute(
+                _INSERT_PAGE_SQL,
+                (url, item['domain'], item.get('title'), item.get('content'),
+                 item.get('status_code'), item.get('content_type')),
+                prepare=True
+            )
+
+            if item.get('metadata'):
+                self.cur.execute(_INSERT_METADATA_BY_URL_SQL, (*_metadata_arrays(item['metadata']), url),
+                                 prepare=True)
+
+            if assets and not copy_assets:
+                self.cur.execute(_INSERT_ASSET_BY_URL_SQL, (*_asset_arrays(assets), url), prepare=True)
+
+            article = item.get('article')
+            if article and (article.get('headline') or article.get('article_text')):
+                self.cur.execute(
+                    _INSERT_ARTICLE_BY_URL_SQL,
+                    (url, article.get('headline'), article.get('author'),
+                     _published_date(article.get('published_date')), article.get('article_text')),
+                    prepare=True
+                )
+
+            result = self._page_cur.fetchone()
+
+        page_id = result[0] if result else None
+        if page_id and copy_assets:
+            self.assets(page_id, assets)
+
+        return page_id
@@ -1,9 +1,27 @@
 import logging
 from datetime import datetime
-from operations import DatabaseOperations
+from operations import DatabaseOperations, Db
 
 logger = logging.getLogger(__name__)
 
+class AssetUploadPipeline:
+    async def process_item(self, item, spider):
+        """Upload the item's assets to Cloudinary (awaited on the reactor's asyncio loop)"""
+        assets = item.get('assets')
+        if not assets:
+            return item
+
+        try:
+            logger.info("Found %d assets", len(assets))
+            item['assets'] = await spider.asset_uploader.upload_assets_concurrent(assets)
+            spider.assets_uploaded += sum(1 for a in item['assets'] if a.cloud_url)
+            logger.info("Total assets uploaded: %d", spider.assets_uploaded)
+        except Exception as e:
+            logger.error(f"Asset upload failed for {item['url']}: {e}")
+
+        # Saved either way; assets without a cloud_url keep their source URL
+        return item
+
 class PostgreSQLPipeline:
     def open_spider(self, spider):
         """Called when spider is opened"""
@@ -27,19 +45,18 @@ class PostgreSQLPipeline:
             total_pages = spider.pages_crawled
             total_assets = spider.assets_uploaded
 
-            # Update statistics
-            DatabaseOperations.update_crawl_statistics(
-                spider.domain,
-                total_pages=total_pages,
-                total_assets=total_assets,
-                status='completed',
-                end_time=datetime.now()
-            )
+            # Write queued log entries before the final status line
+            DatabaseOperations.flush_log_staging()
 
-            DatabaseOperations.insert_log(
+            # Update statistics
+            DatabaseOperations.finalize_crawl(
                 spider.domain,
+                'completed',
                 f"Pipeline closed - Pages: {total_pages}, Assets: {total_assets}",
-                "INFO"
+                "INFO",
+                end_time=datetime.now(),
+                total_pages=total_pages,
+                total_assets=total_assets
             )
 
             logger.info(f"Pipeline closed successfully for {spider.domain}")
@@ -50,43 +67,24 @@ class PostgreSQLPipeline:
     def process_item(self, item, spider):
         """Process each scraped item"""
         try:
-            logger.info(f"Processing item: {item['url']}")
-
-            # Insert page
-            page_id = DatabaseOperations.insert_page(
-                url=item['url'],
-                domain=item['domain'],
-                title=item.get('title'),
-                content=item.get('content'),
-                status_code=item.get('status_code'),
-                content_type=item.get('content_type')
-            )
+            logger.info("Processing item: %s", item['url'])
+
+            if item.get('assets'):
+                item['assets'] = [asset._asdict() for asset in item['assets']]
+
+            # Page, metadata, assets and article are written in one transaction on one checkout
+            with Db() as db:
+                page_id = db.save_item(item)
 
             if not page_id:
                 logger.warning(f"Page already exists or insert failed: {item['url']}")
                 return item
 
-            # Insert metadata
-            if item.get('metadata'):
-                DatabaseOperations.insert_metadata_batch(page_id, item['metadata'])
-                logger.debug(f"Inserted {len(item['metadata'])} metadata entries")
-
-            # Insert assets
-            if item.get('assets'):
-                DatabaseOperations.insert_asset_batch(page_id, item['assets'])
-                logger.debug(f"Inserted {len(item['assets'])} assets")
+            logger.debug("Saved page %s with %d metadata entries and %d assets",
+                         page_id, len(item.get('metadata') or {}), len(item.get('assets') or []))
 
-            # Insert article if exists
             if item.get('article'):
-                article = item['article']
-                DatabaseOperations.insert_article(
-                    page_id=page_id,
-                    headline=article.get('headline'),
-                    author=article.get('author'),
-                    published_date=article.get('published_date'),
-                    article_text=article.get('article_text')
-                )
-                logger.info(f"Inserted article: {article.get('headline', 'No headline')}")
+                logger.info("Inserted article: %s", item['article'].get('headline', 'No headline'))
 
             DatabaseOperations.insert_log(
                 item['domain'],
@@ -1,90 +1,221 @@
 import redis
+import itertools
 import logging
+import threading
+import time
+from cachetools import LRUCache
 from config import Config
 
 logger = logging.getLogger(__name__)
 
+# Writers publish an (empty) invalidation on this channel prefix after every change
+PROGRESS_CHANNEL_PREFIX = "progress_ch:"
+# Domains whose progress one process keeps cached
+PROGRESS_CACHE_SIZE = 10_000
+
+
+class _ProgressCache:
+    """
+    Per-process cache of (progress, total) for polled domains.
+    A background subscriber drops a domain's entry whenever a writer publishes
+    on its channel, so readers only go to Redis after an actual change.
+    Only domains polled here get an entry (LRU-bounded); invalidations for the
+    rest of the cluster's domains find nothing to drop.
+    """
+
+    def __init__(self):
+        # domain -> [token, value or None]; a dropped entry invalidates its token
+        self._entries = LRUCache(maxsize=PROGRESS_CACHE_SIZE)
+        self._tokens = itertools.count(1)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._connected = False
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._listen, name='progress-cache', daemon=True)
+            self._thread.start()
+
+    def lookup(self, domain):
+        """Return (cached value or None, token to pass to store())"""
+        if self._thread is None:
+            self.start()
+        with self._lock:
+            if not self._connected:
+                return None, None
+            entry = self._entries.get(domain)
+            if entry is None:
+                entry = self._entries[domain] = [next(self._tokens), None]
+            return entry[1], entry[0]
+
+    def store(self, domain, value, token):
+        """Cache a value read from Redis unless an invalidation (or eviction) happened since lookup()"""
+        with self._lock:
+            entry = self._entries.get(domain)
+            if self._connected and entry is not None and entry[0] == token:
+                entry[1] = value
+
+    def _invalidate(self, domain):
+        with self._lock:
+            self._entries.pop(domain, None)
+
+    def _set_connected(self, connected):
+        with self._lock:
+            # Anything cached while disconnected may have missed invalidations
+            self._entries.clear()
+            self._connected = connected
+
+    def _listen(self):
+        while True:
+            try:
+                client = redis.from_url(Config.REDIS_URL, decode_responses=True)
+                pubsub = client.pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe(f"{PROGRESS_CHANNEL_PREFIX}*")
+                self._set_connected(True)
+                for message in pubsub.listen():
+                    self._invalidate(message['channel'][len(PROGRESS_CHANNEL_PREFIX):])
+            except Exception as e:
+                logger.warning(f"Progress cache subscriber disconnected: {e}")
+            self._set_connected(False)
+            time.sleep(1)
+
+
+_progress_cache = _ProgressCache()
+
+
+def _as_int(value, default):
+    """Counter value from Redis; keys written by INCRBYFLOAT (older deploys) read as '3.0'"""
+    return int(float(value)) if value else default
+
+# One client (and connection pool) per process; from_url doesn't connect until first use
+_redis = redis.from_url(Config.REDIS_URL, decode_responses=True)
+
 
 class ProgressTracker:
-    def __init__(self, domain, total=100):
+    def __init__(self, domain):
         if not domain:
             raise ValueError("Domain must be provided")
 
         self.domain = domain
 
-        try:
-            self.redis = redis.from_url(Config.REDIS_URL, decode_responses=True)
-            # Test connection
-            self.redis.ping()
-        except Exception as e:
-            logger.error(f"Redis connection failed: {e}")
-            raise
-
         self.key = f"progress:{domain}"
         self.total_key = f"total:{domain}"
-
-        # Initialize if not exists
-        if not self.redis.exists(self.key):
-            self.set_progress(0)
-        if not self.redis.exists(self.total_key):
-            self.set_total(total)
+        self.channel = f"{PROGRESS_CHANNEL_PREFIX}{domain}"
+        # Local copy of the total; it only changes through set_total/reset
+        self._cached_total = None
+        # Missing keys read as 0 / 100, so nothing is written until progress is reported
+        self.redis = _redis
 
     def set_progress(self, value):
         try:
-            self.redis.set(self.key, float(value))
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.set(self.key, int(value))
+            pipe.publish(self.channel, '')
+            pipe.execute()
             logger.info(f"Progress set to {value} for {self.domain}")
         except Exception as e:
             logger.error(f"Failed to set progress: {e}")
 
+    def _increment(self, amount, with_total=False):
+        """INCRBY (+ publish, + GET total); a float left by INCRBYFLOAT is rewritten as an int first"""
+        for attempt in range(2):
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.incrby(self.key, int(amount))
+            pipe.publish(self.channel, '')
+            if with_total:
+                pipe.get(self.total_key)
+            try:
+                return pipe.execute()
+            except redis.ResponseError:
+                if attempt:
+                    raise
+                current = self.redis.get(self.key)
+                self.redis.set(self.key, _as_int(current, 0))
+                logger.info(f"Converted float progress {current!r} to an integer for {self.domain}")
+
     def increment_progress(self, amount=1):
         try:
-            new_val = self.redis.incrbyfloat(self.key, float(amount))
+            new_val = self._increment(amount)[0]
             logger.info(f"Progress incremented by {amount} to {new_val} for {self.domain}")
             return new_val
         except Exception as e:
             logger.error(f"Failed to increment progress: {e}")
             return 0
 
+    def increment_and_get_percentage(self, amount):
+        """Add a batched page count and return the percentage (one round trip)"""
+        try:
+            results = self._increment(amount, with_total=self._cached_total is None)
+            if self._cached_total is None:
+                self._cached_total = _as_int(results[2], 100)
+            return self._percentage(results[0], self._cached_total)
+        except Exception as e:
+            logger.error(f"Failed to increment progress: {e}")
+            return 0.0
+
+    def _read(self):
+        """(progress, total), from the process cache when it is current"""
+        cached, token = _progress_cache.lookup(self.domain)
+        if cached is not None:
+            return cached
+
+        progress, total = self.redis.mget(self.key, self.total_key)
+        value = (_as_int(progress, 0), _as_int(total, 100))
+        _progress_cache.store(self.domain, value, token)
+        return value
+
     def get_progress(self):
         try:
-            val = self.redis.get(self.key)
-            return float(val) if val else 0.0
+            return self._read()[0]
         except Exception as e:
             logger.error(f"Failed to get progress: {e}")
-            return 0.0
+            return 0
 
     def set_total(self, total):
         try:
-            self.redis.set(self.total_key, int(total))
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.set(self.total_key, int(total))
+            pipe.publish(self.channel, '')
+            pipe.execute()
+            self._cached_total = int(total)
         except Exception as e:
             logger.error(f"Failed to set total: {e}")
 
     def get_total(self):
+        if self._cached_total is not None:
+            return self._cached_total
         try:
-            val = self.redis.get(self.total_key)
-            return int(val) if val else 100
+            self._cached_total = self._read()[1]
+            return self._cached_total
         except Exception as e:
             logger.error(f"Failed to get total: {e}")
             return 100
 
+    @staticmethod
+    def _percentage(progress, total):
+        if total == 0:
+            return 0.0
+        return round(min((progress / total) * 100, 100.0), 2)
+
     def get_percentage(self):
         try:
-            total = self.get_total()
-            if total == 0:
-                return 0.0
-            progress = self.get_progress()
-            percentage = min((progress / total) * 100, 100.0)
-            return round(percentage, 2)
+            progress, total = self._read()
+            return self._percentage(progress, total)
         except Exception as e:
             logger.error(f"Failed to get percentage: {e}")
             return 0.0
 
     def reset(self):
         try:
-            self.redis.delete(self.key)
-            self.redis.delete(self.total_key)
-            self.set_progress(0)
-            self.set_total(100)
+            pipe = self.redis.pipeline()
+            pipe.delete(self.key, self.total_key)
+            pipe.set(self.key, 0)
+            pipe.set(self.total_key, 100)
+            pipe.publish(self.channel, '')
+            pipe.execute()
+            self._cached_total = 100
             logger.info(f"Progress reset for {self.domain}")
         except Exception as e:
             logger.error(f"Failed to reset progress: {e}")
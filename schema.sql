@@ -0,0 +1,95 @@
+-- Crawler schema bootstrap; every statement is idempotent.
+-- Executed as one batch by DatabaseOperations.initialize_database.
+
+-- Crawl logs table
+CREATE TABLE IF NOT EXISTS crawl_logs (
+    id SERIAL PRIMARY KEY,
+    domain TEXT NOT NULL,
+    message TEXT NOT NULL,
+    level TEXT NOT NULL,
+    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_crawl_logs_domain ON crawl_logs(domain);
+CREATE INDEX IF NOT EXISTS idx_crawl_logs_timestamp ON crawl_logs(timestamp);
+
+-- Crawl log staging table (UNLOGGED: no WAL, emptied into crawl_logs by LogWriter)
+CREATE UNLOGGED TABLE IF NOT EXISTS crawl_logs_staging (LIKE crawl_logs INCLUDING ALL);
+
+-- Crawled pages table
+CREATE TABLE IF NOT EXISTS crawled_pages (
+    id SERIAL PRIMARY KEY,
+    url TEXT UNIQUE NOT NULL,
+    domain TEXT NOT NULL,
+    title TEXT,
+    content TEXT,
+    status_code INTEGER,
+    content_type TEXT,
+    crawled_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_crawled_pages_domain ON crawled_pages(domain);
+
+-- Page metadata table
+CREATE TABLE IF NOT EXISTS page_metadata (
+    id SERIAL PRIMARY KEY,
+    page_id INTEGER REFERENCES crawled_pages(id) ON DELETE CASCADE,
+    meta_key TEXT NOT NULL,
+    meta_value TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_page_metadata_page_id ON page_metadata(page_id);
+
+-- Assets table
+CREATE TABLE IF NOT EXISTS assets (
+    id SERIAL PRIMARY KEY,
+    page_id INTEGER REFERENCES crawled_pages(id) ON DELETE CASCADE,
+    type TEXT NOT NULL,
+    url TEXT NOT NULL,
+    content BYTEA,
+    file_size INTEGER,
+    cloud_url TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_assets_page_id ON assets(page_id);
+CREATE INDEX IF NOT EXISTS idx_assets_type ON assets(type);
+CREATE INDEX IF NOT EXISTS idx_assets_uploaded_url ON assets(url) WHERE cloud_url IS NOT NULL;
+
+-- Articles table
+CREATE TABLE IF NOT EXISTS articles (
+    id SERIAL PRIMARY KEY,
+    page_id INTEGER REFERENCES crawled_pages(id) ON DELETE CASCADE,
+    headline TEXT,
+    author TEXT,
+    published_date TIMESTAMP,
+    article_text TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+-- (unique index on page_id is created by migrate_database, after de-duplicating)
+
+-- Crawl statistics table
+CREATE TABLE IF NOT EXISTS crawl_statistics (
+    id SERIAL PRIMARY KEY,
+    domain TEXT UNIQUE NOT NULL,
+    total_pages INTEGER DEFAULT 0,
+    total_assets INTEGER DEFAULT 0,
+    status TEXT DEFAULT 'pending',
+    start_time TIMESTAMP,
+    end_time TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- SSL info table
+CREATE TABLE IF NOT EXISTS ssl_info (
+    id SERIAL PRIMARY KEY,
+    domain TEXT UNIQUE NOT NULL,
+    provider TEXT,
+    expiry_date TIMESTAMP,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Schema version marker (single row), so booting processes can skip the DDL above
+CREATE TABLE IF NOT EXISTS schema_version (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    version INTEGER NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
@@ -6,13 +6,23 @@ import scrapy
 from scrapy.http import Request, TextResponse
 from scrapy import signals
 from urllib.parse import urlparse, urljoin, urldefrag
+import asyncio
+import functools
+import io
+from collections import OrderedDict
 import logging
-import hashlib
+import re
+import sys
+import threading
+import time
 from datetime import datetime
-import requests
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import NamedTuple, Optional
+from selectolax.lexbor import LexborHTMLParser
+from twisted.internet.task import LoopingCall
+from concurrent.futures import ThreadPoolExecutor
+import httpx
+from pybloom_live import ScalableBloomFilter
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential_jitter
 from config import Config
 from progress_tracker import ProgressTracker
 from operations import DatabaseOperations
@@ -46,106 +56,252 @@ except Exception as e:
     logger.warning(f"⚠ Cloudinary error: {e}")
 
 
-class AssetUploader:
-    """Concurrent asset uploader with proper connection pooling"""
+# Live stats/progress are pushed at most this often (seconds)
+STATS_FLUSH_INTERVAL = 1.0
+
+# Assets larger than this are skipped
+MAX_ASSET_BYTES = 10 * 1024 * 1024
+
+# Asset fetches in flight per spider
+ASSET_CONCURRENCY = 16
+# Bodies above this go through upload_large in chunks of this size
+UPLOAD_LARGE_THRESHOLD = 6 * 1024 * 1024
+# Upload results remembered per spider (shared chrome: logos, app.js, site CSS)
+ASSET_CACHE_SIZE = 5000
+# Threads running the blocking Cloudinary SDK, shared by every spider in the process
+ASSET_WORKERS = 5
+
+# Content-Type fragments accepted per asset type (checked from the GET headers, before the body)
+_ASSET_CONTENT_TYPES = {
+    'image': ('image/',),
+    'js': ('javascript', 'ecmascript'),
+    'css': ('text/css',),
+}
+# Served for any type by misconfigured hosts; not evidence of a mismatch
+_GENERIC_CONTENT_TYPES = ('application/octet-stream', 'text/plain')
+
+_ASSET_HEADERS = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'}
+
+# Shared by every AssetUploader; created lazily because its connections belong to the reactor's loop
+_http_client = None
+_upload_executor = ThreadPoolExecutor(max_workers=ASSET_WORKERS, thread_name_prefix="asset-up")
+
+
+def _asset_client():
+    """HTTP/2 client: assets from one CDN host share a single multiplexed TLS connection"""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+            headers=_ASSET_HEADERS,
+            timeout=10.0,
+            follow_redirects=True
+        )
+    return _http_client
 
-    def __init__(self, domain, max_workers=5):
-        self.domain = domain
-        self.max_workers = max_workers
 
-        # Create session with proper connection pooling
-        self.session = requests.Session()
+class Asset(NamedTuple):
+    """Asset reference carried on an item (converted to a dict when it is saved)"""
+    type: str
+    url: str
+    cloud_url: Optional[str] = None
+    file_size: Optional[int] = None
 
-        # Configure retry strategy
-        retry_strategy = Retry(
-            total=2,
-            backoff_factor=0.5,
-            status_forcelist=[429, 500, 502, 503, 504],
-        )
 
-        # Configure adapter with larger pool
-        adapter = HTTPAdapter(
-            max_retries=retry_strategy,
-            pool_connections=20,
-            pool_maxsize=20,
-            pool_block=False
-        )
+class RateLimiter:
+    """Spaces calls at least 1/max_per_second apart across threads"""
 
-        self.session.mount("http://", adapter)
-        self.session.mount("https://", adapter)
+    def __init__(self, max_per_second):
+        self._interval = 1.0 / max_per_second if max_per_second > 0 else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
 
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        })
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next, now)
+            self._next = slot + self._interval
+        if slot > now:
+            time.sleep(slot - now)
 
-    def download_and_upload(self, asset_url, asset_type):
-        """Download and upload single asset"""
-        if not CLOUDINARY_ENABLED:
-            return None
 
-        try:
-            response = self.session.get(asset_url, timeout=10, stream=True)
+_UPLOAD_RATE = RateLimiter(max_per_second=Config.CLOUDINARY_RPS)
+
+_RATE_LIMIT_MARKERS = ('rate limit', '420', '429')
 
+
+def _is_rate_limited(exc):
+    """Cloudinary reports throttling as a generic Error; only those are worth retrying"""
+    if not CLOUDINARY_ENABLED or not isinstance(exc, CloudinaryError):
+        return False
+    message = str(exc.args[0]) if exc.args else ''
+    return any(marker in message.lower() for marker in _RATE_LIMIT_MARKERS)
+
+
+@retry(
+    retry=retry_if_exception(_is_rate_limited),
+    wait=wait_exponential_jitter(initial=1, max=30),
+    stop=stop_after_attempt(3),
+    reraise=True
+)
+def _upload(content, **options):
+    """Rate-limited Cloudinary upload (runs on _upload_executor)"""
+    _UPLOAD_RATE.acquire()
+    if len(content) > UPLOAD_LARGE_THRESHOLD:
+        # Chunked, so a stalled connection costs one chunk rather than the whole body
+        return cloudinary.uploader.upload_large(
+            io.BytesIO(content), chunk_size=UPLOAD_LARGE_THRESHOLD, **options
+        )
+    return cloudinary.uploader.upload(content, **options)
+
+
+class AssetUploader:
+    """Async asset fetcher; Cloudinary uploads run on a small shared thread pool"""
+
+    def __init__(self, domain, max_concurrent=ASSET_CONCURRENCY):
+        self.domain = domain
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        # asset URL -> upload result, LRU; only touched from the reactor loop, so no lock
+        self._asset_cache = OrderedDict()
+
+    def _remember(self, asset_url, result):
+        self._asset_cache[asset_url] = result
+        if len(self._asset_cache) > ASSET_CACHE_SIZE:
+            self._asset_cache.popitem(last=False)
+
+    async def _load_known(self, assets_list):
+        """Seed the cache with assets uploaded by earlier crawls (one query per page)"""
+        urls = [asset.url for asset in assets_list if asset.url not in self._asset_cache]
+        if not urls:
+            return
+        # psycopg is blocking; the default executor keeps it off the reactor thread
+        known = await asyncio.get_running_loop().run_in_executor(
+            None, DatabaseOperations.get_uploaded_assets, urls
+        )
+        for asset_url, result in known.items():
+            self._remember(asset_url, result)
+
+    @staticmethod
+    def _type_matches(content_type, asset_type):
+        if not content_type or content_type.startswith(_GENERIC_CONTENT_TYPES):
+            return True
+        return any(fragment in content_type for fragment in _ASSET_CONTENT_TYPES.get(asset_type, ('',)))
+
+    async def _fetch(self, asset_url, asset_type):
+        """Asset body, or None if unavailable, over MAX_ASSET_BYTES or of the wrong type"""
+        async with _asset_client().stream('GET', asset_url) as response:
             if response.status_code != 200:
                 return None
-
             content_length = response.headers.get('content-length')
-            if content_length and int(content_length) > 10 * 1024 * 1024:
+            if content_length and int(content_length) > MAX_ASSET_BYTES:
                 return None
+            # e.g. an HTML error page served with 200 for a missing image
+            if not self._type_matches(response.headers.get('content-type', '').lower(), asset_type):
+                return None
+
+            chunks = []
+            size = 0
+            async for chunk in response.aiter_bytes(64 * 1024):
+                size += len(chunk)
+                if size > MAX_ASSET_BYTES:
+                    return None
+                chunks.append(chunk)
+            return b''.join(chunks)
+
+    async def download_and_upload(self, asset_url, asset_type):
+        """Download and upload single asset"""
+        if not CLOUDINARY_ENABLED:
+            return None
 
-            content = response.content
-            file_size = len(content)
+        cached = self._asset_cache.get(asset_url)
+        if cached is not None:
+            self._asset_cache.move_to_end(asset_url)
+            return cached
+
+        try:
+            async with self._semaphore:
+                content = await self._fetch(asset_url, asset_type)
+            if content is None:
+                return None
 
             # Determine resource type
             resource_type = "raw" if asset_type in ['js', 'css'] else "image"
 
-            # Upload to Cloudinary
-            upload_result = cloudinary.uploader.upload(
-                content,
-                resource_type=resource_type,
-                folder=f"crawler/{self.domain}/{asset_type}",
-                use_filename=True,
-                unique_filename=True,
-                timeout=20
+            # The Cloudinary SDK is blocking; keep it off the reactor thread
+            upload_result = await asyncio.get_running_loop().run_in_executor(
+                _upload_executor,
+                functools.partial(
+                    _upload,
+                    content,
+                    resource_type=resource_type,
+                    folder=f"crawler/{self.domain}/{asset_type}",
+                    use_filename=True,
+                    unique_filename=True,
+                    timeout=20
+                )
             )
 
             cloud_url = upload_result.get('secure_url')
-            logger.info(f"✓ Uploaded {asset_type}: {cloud_url}")
+            logger.info("✓ Uploaded %s: %s", asset_type, cloud_url)
 
-            return {
+            result = {
                 'cloud_url': cloud_url,
-                'file_size': file_size,
+                'file_size': len(content),
             }
+            self._remember(asset_url, result)
+            return result
 
         except Exception as e:
-            logger.debug(f"Upload failed: {str(e)[:80]}")
+            if _is_rate_limited(e):
+                logger.warning("⚠ Cloudinary rate limit, dropped %s", asset_url)
+            else:
+                logger.debug("Upload failed: %.80s", e)
             return None
 
-    def upload_assets_concurrent(self, assets_list):
+    async def upload_assets_concurrent(self, assets_list):
         """Upload multiple assets concurrently"""
         if not CLOUDINARY_ENABLED or not assets_list:
             return assets_list
 
-        uploaded_assets = []
-
-        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-            future_to_asset = {
-                executor.submit(self.download_and_upload, asset['url'], asset['type']): asset
-                for asset in assets_list
-            }
-
-            for future in as_completed(future_to_asset):
-                asset = future_to_asset[future]
-                try:
-                    result = future.result()
-                    if result:
-                        asset['cloud_url'] = result['cloud_url']
-                        asset['file_size'] = result['file_size']
-                except:
-                    pass
-                uploaded_assets.append(asset)
-
-        return uploaded_assets
+        await self._load_known(assets_list)
+        results = await asyncio.gather(
+            *(self.download_and_upload(asset.url, asset.type) for asset in assets_list)
+        )
+        return [
+            asset._replace(cloud_url=result['cloud_url'], file_size=result['file_size']) if result else asset
+            for asset, result in zip(assets_list, results)
+        ]
+
+
+# Binary/media links that are never crawled (also matched before a query string)
+_SKIP_RE = re.compile(r'\.(?:pdf|jpe?g|png|gif|zip|mp[34])(?:$|[?#])', re.I)
+_WS_RE = re.compile(r'\s+')
+_HEADING_TAGS = frozenset(('h1', 'h2', 'h3'))
+# p elements under these count as article text (article p, main p, .post-content p, .entry-content p)
+_ARTICLE_TAGS = frozenset(('article', 'main'))
+_ARTICLE_CLASSES = frozenset(('post-content', 'entry-content'))
+
+
+def _direct_text(node):
+    """Text nodes directly under an element (what ::text selects)"""
+    texts = []
+    for child in node.iter(include_text=True):
+        if child.tag == '-text':
+            text = child.text_content
+            if text:
+                texts.append(text)
+    return texts
+
+
+def _in_article(node):
+    parent = node.parent
+    while parent is not None:
+        if parent.tag in _ARTICLE_TAGS or \
+                not _ARTICLE_CLASSES.isdisjoint((parent.attributes.get('class') or '').split()):
+            return True
+        parent = parent.parent
+    return False
 
 
 class WebCrawlerSpider(scrapy.Spider):
@@ -156,9 +312,9 @@ class WebCrawlerSpider(scrapy.Spider):
 
     custom_settings = {
         'CONCURRENT_REQUESTS': 16,
-        'CONCURRENT_REQUESTS_PER_DOMAIN': 8,
-        'DOWNLOAD_DELAY': 0.5,
-        'RANDOMIZE_DOWNLOAD_DELAY': True,
+        # Per-domain concurrency starts at Scrapy's default (8) and is adapted by AdaptiveConcurrencyMiddleware.
+        # No DOWNLOAD_DELAY / AutoThrottle: a slot delay caps the request rate whatever the
+        # concurrency, and AutoThrottle would steer that delay from the same latency signal.
         'DOWNLOAD_TIMEOUT': 30,
         'ROBOTSTXT_OBEY': False,
 
@@ -174,10 +330,6 @@ class WebCrawlerSpider(scrapy.Spider):
         'RETRY_TIMES': 2,
         'REDIRECT_ENABLED': True,
 
-        'AUTOTHROTTLE_ENABLED': True,
-        'AUTOTHROTTLE_START_DELAY': 0.5,
-        'AUTOTHROTTLE_MAX_DELAY': 3.0,
-
         'DEPTH_LIMIT': 3,
         'CLOSESPIDER_PAGECOUNT': 100,
         'CLOSESPIDER_TIMEOUT': 1800,
@@ -201,22 +353,36 @@ class WebCrawlerSpider(scrapy.Spider):
             raise ValueError("start_url and domain required")
 
         self.start_url = start_url.strip()
-        self.domain = self._clean_domain(domain)
+        # Shared by every item, log line and stats row of the crawl
+        self.domain = sys.intern(self._clean_domain(domain))
         self.allowed_domains = [self.domain]
+        # Links are matched on hostname: the domain key has no port, the start URL may have one
+        start = urlparse(self.start_url)
+        self._host = start.hostname or self.domain
+        # Absolute same-domain links that need no parsing to accept
+        netloc = start.netloc or self.domain
+        self._origin_prefixes = (f'https://{netloc}/', f'http://{netloc}/')
         self.start_urls = [self.start_url]
 
         # Statistics
         self.pages_crawled = 0
         self.pages_failed = 0
         self.assets_uploaded = 0
-        self.urls_seen = set()
+        # Links already scheduled; a rare false positive only skips one URL
+        self.urls_seen = ScalableBloomFilter(initial_capacity=10000, error_rate=0.001)
         self.urls_crawled = set()
 
         # Asset uploader with proper pooling
-        self.asset_uploader = AssetUploader(self.domain, max_workers=5)
+        self.asset_uploader = AssetUploader(self.domain)
 
         # Progress tracking
-        self.progress_tracker = ProgressTracker(self.domain, total=100)
+        # Progress is counted in pages; the total is the page limit
+        page_limit = self.custom_settings['CLOSESPIDER_PAGECOUNT']
+        self.progress_tracker = ProgressTracker(self.domain)
+        self.progress_tracker.set_total(page_limit)
+        self._progress_pending = 0
+        self._stats_dirty = False
+        self._stats_loop = LoopingCall(self._flush_stats)
         self.start_time = datetime.now()
 
         logger.info("=" * 100)
@@ -236,22 +402,39 @@ class WebCrawlerSpider(scrapy.Spider):
             status='running',
             start_time=self.start_time
         )
+        self._stats_loop.start(STATS_FLUSH_INTERVAL, now=False)
 
     def item_scraped(self, item, response, spider):
-        """Called after each item is scraped - update stats in real-time"""
+        """Called after each item is scraped; stats are pushed by _flush_stats"""
+        self._progress_pending += 1
+        self._stats_dirty = True
+
+    def _flush_stats(self):
+        """Push live stats and progress if anything changed (every STATS_FLUSH_INTERVAL)"""
+        if not self._stats_dirty:
+            return
+        self._stats_dirty = False
         try:
-            # Update database statistics immediately
             DatabaseOperations.update_crawl_statistics(
                 domain=self.domain,
                 total_pages=self.pages_crawled,
-                total_assets=self.assets_uploaded,
-                status='running'
+                total_assets=self.assets_uploaded
             )
-            logger.info(f"Stats updated: {self.pages_crawled} pages, {self.assets_uploaded} assets")
+            logger.info("Stats updated: %d pages, %d assets", self.pages_crawled, self.assets_uploaded)
+            self._flush_progress()
         except Exception as e:
             logger.error(f"Failed to update stats: {e}")
 
+    def _flush_progress(self):
+        """Send the accumulated page count in one Redis round trip"""
+        if self._progress_pending:
+            percentage = self.progress_tracker.increment_and_get_percentage(self._progress_pending)
+            self._progress_pending = 0
+            logger.info("Progress: %.1f%%", percentage)
+
     def spider_closed(self, spider, reason):
+        if self._stats_loop.running:
+            self._stats_loop.stop()
         end_time = datetime.now()
         duration = (end_time - self.start_time).total_seconds()
 
@@ -265,22 +448,20 @@ class WebCrawlerSpider(scrapy.Spider):
         logger.info("=" * 100)
 
         # Final stats update
-        DatabaseOperations.update_crawl_statistics(
-            domain=self.domain,
-            total_pages=self.pages_crawled,
-            total_assets=self.assets_uploaded,
-            status='completed' if self.pages_crawled > 0 else 'failed',
-            end_time=end_time
-        )
-
-        DatabaseOperations.insert_log(
+        DatabaseOperations.finalize_crawl(
             self.domain,
+            'completed' if self.pages_crawled > 0 else 'failed',
             f"Crawl finished: {self.pages_crawled} pages, {self.assets_uploaded} assets",
-            "INFO"
+            "INFO",
+            end_time=end_time,
+            total_pages=self.pages_crawled,
+            total_assets=self.assets_uploaded
         )
 
         if self.pages_crawled > 0:
-            self.progress_tracker.set_progress(100)
+            self.progress_tracker.set_progress(self.progress_tracker.get_total())
+        else:
+            self._flush_progress()
 
     def start_requests(self):
         logger.info(f"Starting crawl: {self.start_url}")
@@ -310,81 +491,126 @@ class WebCrawlerSpider(scrapy.Spider):
             return
 
         # Deduplication
-        url_hash = hashlib.md5(url.encode()).hexdigest()
-        if url_hash in self.urls_crawled:
+        if url in self.urls_crawled:
             return
 
-        self.urls_crawled.add(url_hash)
+        self.urls_crawled.add(url)
         self.pages_crawled += 1
 
-        logger.info(f"[{self.pages_crawled}] Crawling: {url}")
+        logger.info("[%d] Crawling: %s", self.pages_crawled, url)
 
         try:
-            # Extract page data
-            item = self._extract_page_data(response)
-
-            # Upload assets
-            if item.get('assets'):
-                logger.info(f"Found {len(item['assets'])} assets")
-                uploaded_assets = self.asset_uploader.upload_assets_concurrent(item['assets'])
-                item['assets'] = uploaded_assets
-                self.assets_uploaded += sum(1 for a in uploaded_assets if a.get('cloud_url'))
-                logger.info(f"Total assets uploaded: {self.assets_uploaded}")
-
-            # Update progress
-            progress_increment = 100.0 / max(self.custom_settings['CLOSESPIDER_PAGECOUNT'], 1)
-            self.progress_tracker.increment_progress(progress_increment)
-
-            logger.info(f"Progress: {self.progress_tracker.get_percentage():.1f}%")
+            # Extract page data (one pass over the DOM)
+            scan = self._scan(response)
+            item = self._extract_page_data(response, scan)
 
+            # Assets are uploaded by AssetUploadPipeline, so links are scheduled without waiting
             yield item
 
             # Follow links
-            for request in self._extract_links(response):
-                yield request
+            yield from self._extract_links(response, scan)
 
         except Exception as e:
             logger.error(f"Error processing {url}: {e}")
             self.pages_failed += 1
 
-    def _extract_page_data(self, response):
-        """Extract data with error handling"""
-        url = response.url
+    def _scan(self, response):
+        """
+        Collect everything the item and link extraction need in one walk over a
+        selectolax tree (document order, matching what the equivalent ::text / ::attr
+        selectors return). Scrapy's own lxml selector is never built.
+        """
+        scan = {
+            'title': None, 'h1': None, 'og_title': None, 'author': None, 'published_date': None,
+            'paragraphs': [], 'headings': [], 'article_paragraphs': [],
+            'metadata': {}, 'images': [], 'scripts': [], 'styles': [], 'links': [],
+        }
 
-        # Title
-        try:
-            title = (response.css('title::text').get(default='').strip() or
-                    response.css('h1::text').get(default='').strip() or
-                    response.css('meta[property="og:title"]::attr(content)').get(default='').strip() or
-                    'Untitled Page')
-        except:
-            title = 'Untitled Page'
-
-        # Content
-        try:
-            paragraphs = response.css('p::text').getall()
-            headings = response.css('h1::text, h2::text, h3::text').getall()
-            content = ' '.join(paragraphs + headings)
-            content = ' '.join(content.split())[:20000]
-        except:
-            content = ''
-
-        # Metadata
-        metadata = {}
-        try:
-            for meta in response.css('meta'):
-                name = meta.attrib.get('name') or meta.attrib.get('property', '')
-                content_val = meta.attrib.get('content', '')
+        tree = LexborHTMLParser(response.text)
+        if tree.root is None:
+            return scan
+
+        for el in tree.root.traverse():
+            tag = el.tag
+            # One dict per element; .attributes builds a new one on every access
+            attrs = el.attributes
+
+            if tag == 'a':
+                value = attrs.get('href')
+                if value is not None:
+                    scan['links'].append(value)
+
+            elif tag == 'p':
+                texts = _direct_text(el)
+                scan['paragraphs'].extend(texts)
+                if texts and _in_article(el):
+                    scan['article_paragraphs'].extend(texts)
+
+            elif tag in _HEADING_TAGS:
+                texts = _direct_text(el)
+                scan['headings'].extend(texts)
+                if tag == 'h1' and scan['h1'] is None and texts:
+                    scan['h1'] = texts[0]
+
+            elif tag == 'meta':
+                content_val = attrs.get('content')
+                name = attrs.get('name') or attrs.get('property') or ''
                 if name and content_val:
-                    metadata[name] = content_val[:500]
-        except:
-            pass
+                    scan['metadata'][name] = content_val[:500]
+                if content_val is not None:
+                    prop = attrs.get('property')
+                    if prop == 'og:title' and scan['og_title'] is None:
+                        scan['og_title'] = content_val
+                    elif prop == 'article:published_time' and scan['published_date'] is None:
+                        scan['published_date'] = content_val
+                    if attrs.get('name') == 'author' and scan['author'] is None:
+                        scan['author'] = content_val
+
+            elif tag == 'title':
+                texts = _direct_text(el)
+                if scan['title'] is None and texts:
+                    scan['title'] = texts[0]
+
+            elif tag == 'img':
+                for attr in ('src', 'data-src'):
+                    value = attrs.get(attr)
+                    if value is not None:
+                        scan['images'].append(value)
+
+            elif tag == 'script':
+                value = attrs.get('src')
+                if value is not None:
+                    scan['scripts'].append(value)
+
+            elif tag == 'link':
+                value = attrs.get('href')
+                if value is not None and attrs.get('rel') == 'stylesheet':
+                    scan['styles'].append(value)
+
+            elif tag == 'time':
+                value = attrs.get('datetime')
+                if value is not None and scan['published_date'] is None:
+                    scan['published_date'] = value
+
+            # [rel="author"] / .author text can sit on any element
+            if scan['author'] is None and (attrs.get('rel') == 'author' or 'author' in (attrs.get('class') or '').split()):
+                texts = _direct_text(el)
+                if texts:
+                    scan['author'] = texts[0]
+
+        return scan
+
+    def _extract_page_data(self, response, scan):
+        """Build the item from a document scan"""
+        url = response.url
 
-        # Assets
-        assets = self._extract_assets(response)
+        title = ((scan['title'] or '').strip() or
+                 (scan['h1'] or '').strip() or
+                 (scan['og_title'] or '').strip() or
+                 'Untitled Page')
 
-        # Article
-        article = self._extract_article(response)
+        # Collapse whitespace once over paragraphs + headings
+        content = _WS_RE.sub(' ', ' '.join(scan['paragraphs'] + scan['headings'])).strip()[:20000]
 
         return {
             'url': url,
@@ -393,85 +619,64 @@ class WebCrawlerSpider(scrapy.Spider):
             'content': content,
             'status_code': response.status,
             'content_type': response.headers.get('Content-Type', b'').decode('utf-8', 'ignore'),
-            'metadata': metadata,
-            'assets': assets,
-            'article': article,
+            'metadata': scan['metadata'],
+            'assets': self._extract_assets(response, scan),
+            'article': self._extract_article(scan),
         }
 
-    def _extract_assets(self, response):
-        """Extract assets"""
+    def _extract_assets(self, response, scan):
+        """Absolute, de-duplicated asset URLs (limited per type)"""
         assets = []
-        base_url = response.url
-
-        try:
-            # Images (limit to 10 per page)
-            for img_url in response.css('img::attr(src), img::attr(data-src)').getall()[:10]:
-                if img_url and not img_url.startswith('data:'):
-                    assets.append({
-                        'type': 'image',
-                        'url': urljoin(base_url, img_url),
-                        'cloud_url': None,
-                        'file_size': None
-                    })
-
-            # JavaScript (limit to 8 per page)
-            for js_url in response.css('script::attr(src)').getall()[:8]:
-                if js_url and not js_url.startswith('data:'):
-                    assets.append({
-                        'type': 'js',
-                        'url': urljoin(base_url, js_url),
-                        'cloud_url': None,
-                        'file_size': None
-                    })
-
-            # CSS (limit to 8 per page)
-            for css_url in response.css('link[rel="stylesheet"]::attr(href)').getall()[:8]:
-                if css_url:
-                    assets.append({
-                        'type': 'css',
-                        'url': urljoin(base_url, css_url),
-                        'cloud_url': None,
-                        'file_size': None
-                    })
-        except Exception as e:
-            logger.warning(f"Asset extraction error: {e}")
-
-        # Deduplicate
         seen = set()
-        unique = []
-        for asset in assets:
-            if asset['url'] not in seen:
-                seen.add(asset['url'])
-                unique.append(asset)
-
-        return unique
-
-    def _extract_article(self, response):
-        """Extract article content"""
-        try:
-            article_text = ' '.join(
-                response.css('article p::text, .post-content p::text, .entry-content p::text, main p::text').getall()
-            ).strip()
-
-            if len(article_text) < 100:
-                return None
+        base_url = response.url
 
-            return {
-                'headline': response.css('h1::text, article h1::text').get(default='').strip(),
-                'author': response.css('[rel="author"]::text, .author::text, meta[name="author"]::attr(content)').get(default='').strip(),
-                'published_date': response.css('time::attr(datetime), meta[property="article:published_time"]::attr(content)').get(),
-                'article_text': article_text[:30000]
-            }
-        except:
+        def add(asset_type, asset_url):
+            absolute_url = urljoin(base_url, asset_url)
+            if absolute_url not in seen:
+                seen.add(absolute_url)
+                assets.append(Asset(asset_type, absolute_url))
+
+        # Images (limit to 10 per page)
+        for img_url in scan['images'][:10]:
+            if img_url and not img_url.startswith('data:'):
+                add('image', img_url)
+
+        # JavaScript (limit to 8 per page)
+        for js_url in scan['scripts'][:8]:
+            if js_url and not js_url.startswith('data:'):
+                add('js', js_url)
+
+        # CSS (limit to 8 per page)
+        for css_url in scan['styles'][:8]:
+            if css_url:
+                add('css', css_url)
+
+        return assets
+
+    def _extract_article(self, scan):
+        """Article content from a document scan"""
+        article_text = ' '.join(scan['article_paragraphs']).strip()
+        if len(article_text) < 100:
             return None
 
-    def _extract_links(self, response):
+        return {
+            'headline': (scan['h1'] or '').strip(),
+            'author': (scan['author'] or '').strip(),
+            'published_date': scan['published_date'],
+            'article_text': article_text[:30000]
+        }
+
+    def _extract_links(self, response, scan):
         """Extract links"""
         try:
-            links = response.css('a::attr(href)').getall()
+            links = scan['links']
             followed = 0
             max_links = 30
 
+            # scheme://host of this page, for joining root-relative links by concatenation
+            page_origin = urljoin(response.url, '/')[:-1]
+            same_host = urlparse(page_origin).hostname == self._host
+
             for link in links:
                 if followed >= max_links:
                     break
@@ -479,27 +684,34 @@ class WebCrawlerSpider(scrapy.Spider):
                 if not link or link.startswith(('#', 'javascript:', 'mailto:')):
                     continue
 
-                absolute_url, _ = urldefrag(urljoin(response.url, link))
-                parsed = urlparse(absolute_url)
-
-                if parsed.netloc != self.domain:
-                    continue
-
-                skip_ext = ('.pdf', '.jpg', '.jpeg', '.png', '.gif', '.zip', '.mp4', '.mp3')
-                if absolute_url.lower().endswith(skip_ext):
+                # Fast paths skip urljoin/urlparse; dot segments still need urljoin to resolve
+                if '/.' in link:
+                    absolute_url = None
+                elif link.startswith(self._origin_prefixes):
+                    absolute_url = link.partition('#')[0]
+                elif same_host and link.startswith('/') and not link.startswith('//'):
+                    absolute_url = page_origin + link.partition('#')[0]
+                else:
+                    absolute_url = None
+
+                if absolute_url is None:
+                    absolute_url, _ = urldefrag(urljoin(response.url, link))
+                    if urlparse(absolute_url).hostname != self._host:
+                        continue
+
+                if _SKIP_RE.search(absolute_url):
                     continue
 
-                url_hash = hashlib.md5(absolute_url.encode()).hexdigest()
-                if url_hash in self.urls_seen:
+                # add() reports whether the URL was (probably) already present
+                if self.urls_seen.add(absolute_url):
                     continue
 
-                self.urls_seen.add(url_hash)
                 followed += 1
 
                 yield Request(absolute_url, callback=self.parse, errback=self.errback)
 
             if followed > 0:
-                logger.info(f"Following {followed} links")
+                logger.info("Following %d links", followed)
         except Exception as e:
             logger.warning(f"Link extraction error: {e}")
 
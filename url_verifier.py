@@ -1,175 +1,487 @@
+"""
+URL verification: DNS, TCP connect and TLS handshake checks, with cached results.
+
+Each phase has its own budget, set through the environment (seconds):
+    VERIFY_DNS_TIMEOUT   DNS lookup, all record types together (default 1.0)
+    VERIFY_SOCK_TIMEOUT  TCP connect to port 443, all resolved addresses together (default 2.0)
+    VERIFY_SSL_TIMEOUT   TLS handshake (default 2.0)
+check_domain also sets one overall deadline of their sum (VERIFY_BUDGET) and cuts
+every step's timeout to what is left of it, so the pool thread is done by then too.
+A domain that doesn't resolve is not connected to at all. Only direct
+check_ssl / check_socket_and_ssl callers (no addresses) connect by name, through
+getaddrinfo, which is bounded by the system resolver instead.
+"""
+
+import atexit
+import ipaddress
 import socket
 import ssl
+import threading
+import time
 from urllib.parse import urlparse
 import logging
 import datetime
-from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
-import requests
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
+import dns.exception
+import dns.resolver
+import httpx
+from cachetools import TTLCache
+from config import Config
 
 logger = logging.getLogger(__name__)
 
+DNS_TIMEOUT = Config.VERIFY_DNS_TIMEOUT
+SOCK_TIMEOUT = Config.VERIFY_SOCK_TIMEOUT
+SSL_TIMEOUT = Config.VERIFY_SSL_TIMEOUT
+VERIFY_BUDGET = DNS_TIMEOUT + SOCK_TIMEOUT + SSL_TIMEOUT
+
+# Successful verifications, keyed by domain (DNS TTLs are typically >= 300s)
+VERIFY_CACHE_TTL = 300
+# Certificates change far less often; a cached entry is also dropped once it has expired
+SSL_CACHE_TTL = 3600
+
+_verify_cache = TTLCache(maxsize=10_000, ttl=VERIFY_CACHE_TTL)
+_ssl_cache = TTLCache(maxsize=10_000, ttl=SSL_CACHE_TTL)
+_cache_lock = threading.Lock()
+
+# Long-lived pool for the per-verification checks (threads are reused, never torn down per call)
+_EXECUTOR = ThreadPoolExecutor(max_workers=Config.VERIFY_POOL_SIZE, thread_name_prefix="url-verify")
+atexit.register(_EXECUTOR.shutdown, wait=False)
+
+# Per-query timeouts without touching the process-wide socket default
+_RESOLVER = dns.resolver.Resolver()
+_RESOLVER.timeout = DNS_TIMEOUT
+_RESOLVER.lifetime = DNS_TIMEOUT
+# Answers are reused until their record TTL runs out
+_RESOLVER.cache = dns.resolver.LRUCache(max_size=10_000)
+
+# Built once: create_default_context() loads and parses the system CA bundle (safe to share across threads)
+_SSL_CTX = ssl.create_default_context()
+_SSL_CTX.check_hostname = True
+_SSL_CTX.verify_mode = ssl.CERT_REQUIRED
+
+# IPv4 only unless IPv6 is opted into
+_ADDRESS_FAMILY = socket.AF_UNSPEC if Config.VERIFY_FORCE_IPV6 else socket.AF_INET
+_RECORD_TYPES = ("A", "AAAA") if Config.VERIFY_FORCE_IPV6 else ("A",)
+
+# Keep-alive connections reused across check_url_http calls (HTTP/2 multiplexes same-host checks)
+_HTTP_CLIENT = httpx.Client(
+    http2=True,
+    timeout=5.0,
+    follow_redirects=True,
+    limits=httpx.Limits(max_keepalive_connections=256, keepalive_expiry=85.0)
+)
+atexit.register(_HTTP_CLIENT.close)
+
+
+def clear_verification_cache():
+    """Forget all cached verification and SSL results"""
+    with _cache_lock:
+        _verify_cache.clear()
+        _ssl_cache.clear()
+
 
 def verify_url(url):
     """
     Verify URL with fast timeouts and parallel checks
-    Maximum execution time: ~10 seconds
+    Maximum execution time: VERIFY_BUDGET (~5 seconds by default)
     """
-    try:
-        parsed_url = urlparse(url)
-        domain = parsed_url.netloc or parsed_url.path
+    return verify_url_cached(url)[0]
 
-        if not domain:
-            logger.error(f"Could not extract domain from URL: {url}")
-            return {}
 
-        logger.info(f"Verifying {url} (domain: {domain})")
+def verify_url_cached(url):
+    """verify_url, also reporting whether the result came from the cache ('HIT' / 'MISS')"""
+    domain = _domain_of(url)
 
-        result = {
-            'domain': domain,
-            'dns_valid': False,
-            'whois_valid': False,
-            'socket_valid': False,
-            'ssl_provider': 'Unknown',
-            'ssl_expiry': None
-        }
+    cached = _cached(domain)
+    if cached is not None:
+        logger.info("Verification cache hit for %s", domain)
+        return cached, 'HIT'
 
-        # Run checks in parallel with timeout
-        with ThreadPoolExecutor(max_workers=3) as executor:
-            # DNS check
-            dns_future = executor.submit(check_dns, domain)
+    result = _verify(url, domain)
+    _store(result)
+    return result, 'MISS'
 
-            # Socket check (includes implicit DNS check)
-            socket_future = executor.submit(check_socket, domain)
 
-            # SSL check
-            ssl_future = executor.submit(check_ssl, domain)
+def verify_urls(urls, timeout=15):
+    """
+    Verify several URLs at once: the checks of every uncached domain are submitted
+    to the shared pool together and collected as they complete.
+    Returns {url: result} in the same shape as verify_url.
+    """
+    by_domain = {}
+    url_domains = {}
+    futures = {}
 
-            # Collect results with timeout
-            try:
-                result['dns_valid'] = dns_future.result(timeout=3)
-            except Exception as e:
-                logger.warning(f"DNS check failed: {e}")
+    for url in urls:
+        domain = _domain_of(url)
+        url_domains[url] = domain
+        if not domain or domain in by_domain:
+            continue
+        cached = _cached(domain)
+        if cached is not None:
+            by_domain[domain] = cached
+            continue
+        by_domain[domain] = _new_result(domain)
+        futures[_EXECUTOR.submit(check_domain, domain)] = domain
 
+    try:
+        for future in as_completed(futures, timeout=timeout):
+            domain = futures[future]
             try:
-                result['socket_valid'] = socket_future.result(timeout=5)
+                _apply_checks(by_domain[domain], future.result())
             except Exception as e:
-                logger.warning(f"Socket check failed: {e}")
+                logger.warning("Checks failed for %s: %s", domain, e)
+    except FuturesTimeoutError:
+        logger.warning("Batch verification timed out after %ss", timeout)
+
+    for domain in futures.values():
+        _finish(by_domain[domain])
+        _store(by_domain[domain])
+
+    return {url: dict(by_domain[domain]) if domain else {} for url, domain in url_domains.items()}
+
+
+@lru_cache(maxsize=4096)
+def _domain_of(url):
+    """
+    Host of a URL, normalized once so it can key the caches:
+    no userinfo or port, lower-case, no trailing dot (IPv6 literals lose their brackets).
+    Memoized: re-verified URLs skip the parse entirely.
+    """
+    parsed_url = urlparse(url.strip())
+    host = (parsed_url.netloc or parsed_url.path.split('/')[0]).rpartition('@')[2]
+    if host.startswith('['):
+        host = host[1:host.find(']')]
+    else:
+        host = host.split(':')[0]
+    return host.strip().lower().rstrip('.')
 
-            try:
-                ssl_info = ssl_future.result(timeout=5)
-                if ssl_info:
-                    result['ssl_provider'] = ssl_info.get('provider', 'Unknown')
-                    result['ssl_expiry'] = ssl_info.get('expiry')
-            except Exception as e:
-                logger.warning(f"SSL check failed: {e}")
 
-        # Skip WHOIS check - it's too slow and unreliable
-        # If DNS and socket checks pass, that's sufficient validation
-        result['whois_valid'] = result['dns_valid'] and result['socket_valid']
+def _cached(domain):
+    """Copy of a cached verification, or None"""
+    if not domain:
+        return None
+    with _cache_lock:
+        cached = _verify_cache.get(domain)
+    return dict(cached) if cached is not None else None
+
+
+def _store(result):
+    """Cache a verification if it passed"""
+    if result.get('dns_valid') and result.get('socket_valid'):
+        with _cache_lock:
+            _verify_cache[result['domain']] = dict(result)
+
+
+def _new_result(domain):
+    return {
+        'domain': domain,
+        'dns_valid': False,
+        'whois_valid': False,
+        'socket_valid': False,
+        'ssl_provider': 'Unknown',
+        'ssl_expiry': None
+    }
+
+
+def _apply_checks(result, checks):
+    """Copy a check_domain outcome into a verification result"""
+    result['dns_valid'] = checks['dns_valid']
+    result['socket_valid'] = checks['socket_valid']
+    ssl_info = checks['ssl_info']
+    if ssl_info:
+        result['ssl_provider'] = ssl_info.get('provider', 'Unknown')
+        result['ssl_expiry'] = ssl_info.get('expiry')
+
+
+def _finish(result):
+    # Skip WHOIS check - it's too slow and unreliable
+    # If DNS and socket checks pass, that's sufficient validation
+    result['whois_valid'] = result['dns_valid'] and result['socket_valid']
+
+    logger.info("Verification complete for %s: DNS=%s, Socket=%s, SSL=%s",
+                result['domain'], result['dns_valid'], result['socket_valid'], result['ssl_provider'])
+
+
+def _verify(url, domain):
+    """Run the DNS / socket / SSL checks for a domain"""
+    try:
+        if not domain:
+            logger.error("Could not extract domain from URL: %s", url)
+            return {}
+
+        logger.info("Verifying %s (domain: %s)", url, domain)
+
+        result = _new_result(domain)
+
+        # DNS, socket and SSL checks share one resolution and one connection
+        checks_future = _EXECUTOR.submit(check_domain, domain)
 
-        logger.info(f"Verification complete for {domain}: DNS={result['dns_valid']}, "
-                   f"Socket={result['socket_valid']}, SSL={result['ssl_provider']}")
+        try:
+            # Resolve, connect, handshake (check_domain stops at the same deadline)
+            _apply_checks(result, checks_future.result(timeout=VERIFY_BUDGET))
+        except Exception as e:
+            logger.warning("DNS/socket/SSL checks failed: %s", e)
 
+        _finish(result)
         return result
 
     except Exception as e:
-        logger.error(f"Verification failed for {url}: {e}")
+        logger.error("Verification failed for %s: %s", url, e)
         return {}
 
 
+def check_domain(domain):
+    """
+    Resolve the domain once and run the socket/SSL check against the resolved
+    addresses: {'dns_valid', 'socket_valid', 'ssl_info'}, all within VERIFY_BUDGET
+    """
+    deadline = time.monotonic() + VERIFY_BUDGET
+    ip = ip_literal(domain)
+    # An IP literal needs no lookup (TLS then matches the IP against the certificate's SANs)
+    addresses = [ip] if ip else _resolve(domain, deadline)
+    if not addresses:
+        # NXDOMAIN or a resolver timeout: a second lookup by name wouldn't do better
+        return {'dns_valid': False, 'socket_valid': False, 'ssl_info': None}
+    return {'dns_valid': True, **check_socket_and_ssl(domain, addresses, deadline)}
+
+
+def _deadline(timeout, overall=None):
+    """time.monotonic() value by which a phase must finish"""
+    end = time.monotonic() + timeout
+    return end if overall is None else min(end, overall)
+
+
+def _time_left(deadline):
+    """Seconds until `deadline`; raises socket.timeout once it has passed"""
+    left = deadline - time.monotonic()
+    if left <= 0:
+        raise socket.timeout("verification deadline exceeded")
+    return left
+
+
+def ip_literal(domain):
+    """The IP address if the domain is an IPv4/IPv6 literal (optionally [bracketed] / with a port), else None"""
+    host = domain
+    if host.startswith('['):
+        host = host[1:host.find(']')]
+    elif host.count(':') == 1:
+        host = host.split(':')[0]
+    try:
+        return str(ipaddress.ip_address(host))
+    except ValueError:
+        return None
+
+
 def check_dns(domain):
     """Check DNS resolution with timeout"""
-    try:
-        socket.setdefaulttimeout(2)
-        socket.gethostbyname(domain)
-        logger.debug(f"DNS check passed for {domain}")
-        return True
-    except socket.gaierror as e:
-        logger.warning(f"DNS resolution failed for {domain}: {e}")
-        return False
-    except Exception as e:
-        logger.warning(f"DNS check error for {domain}: {e}")
-        return False
-    finally:
-        socket.setdefaulttimeout(None)
+    return bool(_resolve(domain))
+
+
+def _resolve(domain, deadline=None):
+    """Addresses of the domain (IPv4, plus IPv6 with VERIFY_FORCE_IPV6), or None if it doesn't resolve"""
+    deadline = _deadline(DNS_TIMEOUT, deadline)
+    addresses = []
+    error = None
+    for record_type in _RECORD_TYPES:
+        try:
+            answers = _RESOLVER.resolve(domain, record_type, lifetime=_time_left(deadline))
+            addresses.extend(rr.address for rr in answers)
+        except socket.timeout as e:
+            # DNS budget used up: keep what the earlier record types returned
+            error = e
+            break
+        except dns.exception.DNSException as e:
+            error = e
+        except Exception as e:
+            logger.warning("DNS check error for %s: %s", domain, e)
+            return None
+
+    if not addresses:
+        logger.warning("DNS resolution failed for %s: %s", domain, error)
+        return None
+    logger.debug("DNS check passed for %s", domain)
+    return addresses
+
+
+def _connect(domain, addresses, deadline=None):
+    """
+    TCP connection to port 443 on the first reachable address (by name if none were resolved).
+    The attempts share one SOCK_TIMEOUT budget.
+    """
+    if not addresses:
+        # create_connection() would ask for A and AAAA records; only query the families in use
+        addresses = [info[4][0] for info in socket.getaddrinfo(
+            domain, 443, family=_ADDRESS_FAMILY, type=socket.SOCK_STREAM, flags=socket.AI_NUMERICSERV
+        )]
+
+    deadline = _deadline(SOCK_TIMEOUT, deadline)
+    error = None
+    for address in addresses:
+        try:
+            return _open_socket(address, _time_left(deadline))
+        except OSError as e:
+            error = e
+    raise error
 
 
-def check_socket(domain):
-    """Check socket connection with timeout"""
+def _open_socket(address, timeout=SOCK_TIMEOUT):
+    """Connect to an IP address with the socket options set before the handshake"""
+    sock = socket.socket(socket.AF_INET6 if ':' in address else socket.AF_INET, socket.SOCK_STREAM)
     try:
-        sock = socket.create_connection((domain, 443), timeout=3)
+        _tune_socket(sock)
+        sock.settimeout(timeout)
+        sock.connect((address, 443))
+        return sock
+    except BaseException:
         sock.close()
-        logger.debug(f"Socket check passed for {domain}")
+        raise
+
+
+def _tune_socket(sock):
+    """No Nagle delay on the ClientHello; dead peers fail within SSL_TIMEOUT instead of hanging"""
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    if hasattr(socket, 'TCP_USER_TIMEOUT'):  # Linux only
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_USER_TIMEOUT, int(SSL_TIMEOUT * 1000))
+
+
+_MONTHS = {"Jan": 1, "Feb": 2, "Mar": 3, "Apr": 4, "May": 5, "Jun": 6,
+           "Jul": 7, "Aug": 8, "Sep": 9, "Oct": 10, "Nov": 11, "Dec": 12}
+
+
+def _parse_notafter(value):
+    """
+    Parse a getpeercert() date such as 'Mar 15 23:59:59 2026 GMT' (always GMT).
+    Returns a naive UTC datetime, as the ssl_info.expiry_date column expects.
+    """
+    mon, day, hms, year = value.split()[:4]
+    hour, minute, second = hms.split(":")
+    return datetime.datetime(int(year), _MONTHS[mon], int(day), int(hour), int(minute), int(second))
+
+
+def _ssl_still_valid(ssl_info):
+    """Only the time-dependent part of a cached certificate needs re-checking"""
+    expiry = ssl_info.get('expiry')
+    if expiry is None:
         return True
-    except (socket.timeout, socket.gaierror, ConnectionRefusedError, OSError) as e:
-        logger.warning(f"Socket connection failed for {domain}: {e}")
-        return False
-    except Exception as e:
-        logger.warning(f"Socket check error for {domain}: {e}")
-        return False
+    if expiry.tzinfo:
+        return expiry > datetime.datetime.now(expiry.tzinfo)
+    # Naive expiries are UTC (see _parse_notafter)
+    return expiry > datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
 
 
 def check_ssl(domain):
     """Check SSL certificate with timeout"""
+    return check_socket_and_ssl(domain)['ssl_info']
+
+
+def check_socket_and_ssl(domain, addresses=None, deadline=None):
+    """
+    Connect to port 443 once: the TCP connect is the socket check and the TLS
+    handshake on the same connection reads the certificate (SNI still uses the domain).
+    Pass already-resolved `addresses` to skip the getaddrinfo lookup.
+    Successful SSL results are cached for SSL_CACHE_TTL (the connect still runs).
+    `deadline` (time.monotonic()) caps both steps on top of their own timeouts.
+    """
+    result = {'socket_valid': False, 'ssl_info': None}
+    cached = _cached_ssl(domain)
+
     try:
-        context = ssl.create_default_context()
-        context.check_hostname = True
-        context.verify_mode = ssl.CERT_REQUIRED
-
-        with socket.create_connection((domain, 443), timeout=3) as sock:
-            with context.wrap_socket(sock, server_hostname=domain) as ssock:
-                cert = ssock.getpeercert()
-
-                # Parse issuer information
-                issuer = {}
-                if cert and 'issuer' in cert:
-                    for item in cert['issuer']:
-                        if isinstance(item, tuple) and len(item) > 0:
-                            for key_val in item:
-                                if isinstance(key_val, tuple) and len(key_val) == 2:
-                                    issuer[key_val[0]] = key_val[1]
-
-                ssl_provider = issuer.get('organizationName', issuer.get('commonName', 'Unknown'))
-
-                # Parse expiry date
-                ssl_expiry = None
-                if cert and 'notAfter' in cert:
-                    try:
-                        expiry_str = cert['notAfter']
-                        ssl_expiry = datetime.datetime.strptime(expiry_str, '%b %d %H:%M:%S %Y %Z')
-                    except ValueError:
-                        # Try alternative format
-                        try:
-                            ssl_expiry = datetime.datetime.strptime(expiry_str, '%b %d %H:%M:%S %Y %z')
-                        except ValueError:
-                            logger.warning(f"Could not parse SSL expiry date: {expiry_str}")
-
-                logger.debug(f"SSL check passed for {domain}: Provider={ssl_provider}, Expiry={ssl_expiry}")
-
-                return {
-                    'provider': ssl_provider,
-                    'expiry': ssl_expiry
-                }
+        sock = _connect(domain, addresses, deadline)
+    except (socket.timeout, socket.gaierror, ConnectionRefusedError, OSError) as e:
+        logger.warning("Socket connection failed for %s: %s", domain, e)
+        return result
+    except Exception as e:
+        logger.warning("Socket check error for %s: %s", domain, e)
+        return result
+
+    with sock:
+        result['socket_valid'] = True
+        logger.debug("Socket check passed for %s", domain)
+        if cached is not None:
+            result['ssl_info'] = cached
+            return result
+        ssl_info = _fetch_ssl(sock, domain, deadline)
+
+    _store_ssl(domain, ssl_info)
+    result['ssl_info'] = ssl_info
+    return result
+
+
+def _cached_ssl(domain):
+    """Copy of a cached, unexpired SSL result, or None"""
+    with _cache_lock:
+        cached = _ssl_cache.get(domain)
+    if cached is None or not _ssl_still_valid(cached):
+        return None
+    return dict(cached)
+
+
+def _store_ssl(domain, ssl_info):
+    """Cache a successful SSL result; a failure drops the domain's entry"""
+    with _cache_lock:
+        if ssl_info:
+            _ssl_cache[domain] = dict(ssl_info)
+        else:
+            _ssl_cache.pop(domain, None)
+
+
+def _fetch_ssl(sock, domain, deadline=None):
+    """TLS handshake on a connected socket; returns the certificate's provider and expiry"""
+    try:
+        sock.settimeout(_time_left(_deadline(SSL_TIMEOUT, deadline)))
+        with _SSL_CTX.wrap_socket(sock, server_hostname=domain) as ssock:
+            return _cert_info(ssock.getpeercert(), domain)
 
     except ssl.SSLError as e:
-        logger.warning(f"SSL error for {domain}: {e}")
+        logger.warning("SSL error for %s: %s", domain, e)
         return None
     except (socket.timeout, socket.gaierror, ConnectionRefusedError, OSError) as e:
-        logger.warning(f"SSL connection failed for {domain}: {e}")
+        logger.warning("SSL connection failed for %s: %s", domain, e)
         return None
     except Exception as e:
-        logger.warning(f"SSL check error for {domain}: {e}")
+        logger.warning("SSL check error for %s: %s", domain, e)
         return None
 
 
+def _cert_info(cert, domain):
+    """Provider and expiry of a getpeercert() dict"""
+    # Parse issuer information: getpeercert() gives ((('organizationName', 'Foo'),), ...)
+    issuer = dict(
+        item[0] for item in cert.get('issuer', ())
+        if item and isinstance(item[0], tuple) and len(item[0]) == 2
+    ) if cert else {}
+
+    ssl_provider = issuer.get('organizationName', issuer.get('commonName', 'Unknown'))
+
+    # Parse expiry date
+    ssl_expiry = None
+    if cert and 'notAfter' in cert:
+        expiry_str = cert['notAfter']
+        try:
+            ssl_expiry = _parse_notafter(expiry_str)
+        except (ValueError, KeyError):
+            logger.warning("Could not parse SSL expiry date: %s", expiry_str)
+
+    logger.debug("SSL check passed for %s: Provider=%s, Expiry=%s", domain, ssl_provider, ssl_expiry)
+
+    return {
+        'provider': ssl_provider,
+        'expiry': ssl_expiry
+    }
+
+
 def check_url_http(url, timeout=5):
     """
     Optional: Check URL accessibility via HTTP request
     Use this if you want to verify the URL actually returns content
     """
     try:
-        response = requests.head(url, timeout=timeout, allow_redirects=True)
+        response = _HTTP_CLIENT.head(url, timeout=timeout)
         return response.status_code < 400
-    except requests.RequestException as e:
-        logger.warning(f"HTTP check failed for {url}: {e}")
+    except httpx.HTTPError as e:
+        logger.warning("HTTP check failed for %s: %s", url, e)
         return False
@@ -0,0 +1,149 @@
+"""
+asyncio URL verification: aiodns for DNS and one asyncio connection for both the
+socket check and the TLS handshake, so concurrent verifications need no threads.
+Results have the same shape as url_verifier.verify_url and share its caches and timeouts.
+"""
+
+import asyncio
+import logging
+import socket
+import ssl
+import weakref
+import aiodns
+from url_verifier import (
+    DNS_TIMEOUT, SOCK_TIMEOUT, SSL_TIMEOUT, _RECORD_TYPES, _SSL_CTX, _cached, _cached_ssl, _cert_info,
+    _domain_of, _finish, _new_result, _store, _store_ssl, ip_literal
+)
+
+logger = logging.getLogger(__name__)
+
+# aiodns resolvers belong to the loop they were created on
+_resolvers = weakref.WeakKeyDictionary()
+
+
+def _resolver():
+    loop = asyncio.get_running_loop()
+    resolver = _resolvers.get(loop)
+    if resolver is None:
+        resolver = _resolvers[loop] = aiodns.DNSResolver(timeout=DNS_TIMEOUT, tries=1)
+    return resolver
+
+
+def verify_url(url):
+    """Blocking wrapper for callers without an event loop"""
+    return asyncio.run(verify_url_async(url))
+
+
+async def verify_url_async(url):
+    """Verify URL without blocking the event loop (cached like url_verifier.verify_url)"""
+    domain = _domain_of(url)
+    if not domain:
+        logger.error("Could not extract domain from URL: %s", url)
+        return {}
+
+    cached = _cached(domain)
+    if cached is not None:
+        logger.info("Verification cache hit for %s", domain)
+        return cached
+
+    logger.info("Verifying %s (domain: %s)", url, domain)
+    result = _new_result(domain)
+
+    try:
+        ip = ip_literal(domain)
+        addresses = [ip] if ip else await _resolve(domain)
+        result['dns_valid'] = bool(addresses)
+        # A domain that doesn't resolve isn't connected to by name either
+        if addresses:
+            await _check_connection(result, domain, addresses)
+    except Exception as e:
+        logger.error("Verification failed for %s: %s", url, e)
+        return {}
+
+    _finish(result)
+    _store(result)
+    return result
+
+
+async def _resolve(domain):
+    """
+    Addresses of the domain (IPv4, plus IPv6 with VERIFY_FORCE_IPV6), or None if it doesn't resolve.
+    The record types share one DNS_TIMEOUT budget, as in url_verifier.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + DNS_TIMEOUT
+    addresses = []
+    error = None
+    for record_type in _RECORD_TYPES:
+        left = deadline - loop.time()
+        if left <= 0:
+            break
+        try:
+            answers = await asyncio.wait_for(_resolver().query(domain, record_type), left)
+            addresses.extend(answer.host for answer in answers)
+        except asyncio.TimeoutError as e:
+            # Budget used up: keep what the earlier record types returned
+            error = e
+            break
+        except aiodns.error.DNSError as e:
+            error = e
+
+    if not addresses:
+        logger.warning("DNS resolution failed for %s: %s", domain, error)
+        return None
+    logger.debug("DNS check passed for %s", domain)
+    return addresses
+
+
+async def _open(addresses):
+    """
+    TCP connection to port 443 on the first reachable resolved address.
+    The attempts share one SOCK_TIMEOUT budget, as in url_verifier.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + SOCK_TIMEOUT
+    error = None
+    for host in addresses:
+        left = deadline - loop.time()
+        if left <= 0:
+            break
+        try:
+            family = socket.AF_INET6 if ':' in host else socket.AF_INET
+            return await asyncio.wait_for(asyncio.open_connection(host, 443, family=family), left)
+        except (asyncio.TimeoutError, OSError) as e:
+            error = e
+    raise error
+
+
+async def _check_connection(result, domain, addresses):
+    """Socket check, then the TLS handshake on the same connection (skipped on an SSL cache hit)"""
+    try:
+        _, writer = await _open(addresses)
+    except (asyncio.TimeoutError, OSError) as e:
+        logger.warning("Socket connection failed for %s: %s", domain, e)
+        return
+
+    try:
+        result['socket_valid'] = True
+        logger.debug("Socket check passed for %s", domain)
+
+        ssl_info = _cached_ssl(domain)
+        if ssl_info is None:
+            try:
+                await asyncio.wait_for(writer.start_tls(_SSL_CTX, server_hostname=domain), SSL_TIMEOUT)
+                ssl_info = _cert_info(writer.get_extra_info('peercert'), domain)
+            except ssl.SSLError as e:
+                logger.warning("SSL error for %s: %s", domain, e)
+            except (asyncio.TimeoutError, OSError) as e:
+                logger.warning("SSL connection failed for %s: %s", domain, e)
+            _store_ssl(domain, ssl_info)
+
+        if ssl_info:
+            result['ssl_provider'] = ssl_info.get('provider', 'Unknown')
+            result['ssl_expiry'] = ssl_info.get('expiry')
+    finally:
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except Exception:
+            pass